@@ -1,6 +1,7 @@
 import streamlit as st
 from config import CUSTOM_CSS, setup_page_config, initialize_session_state
-from ui import render_header, render_sidebar, render_main_content
+from ui import render_header, render_sidebar, render_main_content, resume_checkpoint
+from hibernation import session_activity
 
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
@@ -8,7 +9,11 @@ setup_page_config()
 
 initialize_session_state()
 
-render_header()
-render_sidebar()
-render_main_content()
+# Wakes the session first if it was hibernated while idle
+with session_activity():
+    resume_checkpoint()
+
+    render_header()
+    render_sidebar()
+    render_main_content()
 
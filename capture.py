@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import logging
+import weakref
+import tempfile
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from config import OUTPUT_HEAD_CHARS, OUTPUT_TAIL_CHARS, OUTPUT_PAGE_BYTES
+
+# Buffers of the cell running in the current thread/context, if any
+_stdout_target = contextvars.ContextVar('cell_stdout', default=None)
+_stderr_target = contextvars.ContextVar('cell_stderr', default=None)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class OutputSpill:
+    """Full text of an output that outgrew the in-memory buffer, kept in a temp file.
+
+    The file is removed when the last reference to the handle goes away.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size  # bytes
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    def __reduce__(self):
+        return (OutputSpill, (self.path, self.size))
+
+    @property
+    def pages(self):
+        return max(1, -(-self.size // OUTPUT_PAGE_BYTES))
+
+    def read_page(self, page):
+        """Text of one OUTPUT_PAGE_BYTES slice of the file (0-based page)"""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(page * OUTPUT_PAGE_BYTES)
+                data = f.read(OUTPUT_PAGE_BYTES)
+        except OSError:
+            return ''
+        # A page boundary can split a multi-byte character
+        return data.decode('utf-8', errors='replace')
+
+    def detach(self):
+        """Stop owning the file, before handing the handle to another process"""
+        self._finalizer.detach()
+
+
+class OutputBuffer:
+    """Captured output with bounded memory: the first OUTPUT_HEAD_CHARS and a ring
+    of the last OUTPUT_TAIL_CHARS characters.
+
+    With spill set, everything is also written to a temp file once the
+    output outgrows head + tail, so it can still be paged through.
+    """
+
+    def __init__(self, spill=True):
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self._spill = spill
+        self._file = None
+        self.size = 0
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        written = len(text)
+        if self._spill and self._file is None and self.size + len(text) > OUTPUT_HEAD_CHARS + OUTPUT_TAIL_CHARS:
+            # Nothing has been dropped yet, so head + tail is everything so far
+            self._file = tempfile.NamedTemporaryFile(
+                'w', encoding='utf-8', errors='replace', prefix='notebook-output-', suffix='.txt', delete=False
+            )
+            self._file.write(''.join(self._head) + ''.join(self._tail))
+        if self._file is not None:
+            self._file.write(text)
+        self.size += written
+
+        room = OUTPUT_HEAD_CHARS - self._head_size
+        if room > 0:
+            self._head.append(text[:room])
+            self._head_size += len(self._head[-1])
+            text = text[room:]
+        if text:
+            self._tail.append(text)
+            self._tail_size += len(text)
+            while self._tail_size > OUTPUT_TAIL_CHARS:
+                excess = self._tail_size - OUTPUT_TAIL_CHARS
+                if len(self._tail[0]) <= excess:
+                    self._tail_size -= len(self._tail.popleft())
+                else:
+                    self._tail[0] = self._tail[0][excess:]
+                    self._tail_size -= excess
+        return written
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    @property
+    def truncated(self):
+        return self.size > self._head_size + self._tail_size
+
+    def getvalue(self):
+        head = ''.join(self._head)
+        tail = ''.join(self._tail)
+        if not self.truncated:
+            return head + tail
+        omitted = self.size - self._head_size - self._tail_size
+        return f"{head}\n... {omitted:,} characters not shown ...\n{tail}"
+
+    def spill(self):
+        """Close the spill file and return its OutputSpill handle, or None if nothing spilled"""
+        if self._file is None:
+            return None
+        self._file.close()
+        spilled = OutputSpill(self._file.name, os.path.getsize(self._file.name))
+        self._file = None
+        self._spill = False
+        return spilled
+
+    def discard(self):
+        """Close and delete the spill file, if any, when its output won't be kept"""
+        if self._file is None:
+            return
+        self._file.close()
+        _remove_file(self._file.name)
+        self._file = None
+        self._spill = False
+
+
+class StreamingBuffer(OutputBuffer):
+    """Output buffer that also hands new text to send(), at most every interval seconds"""
+
+    def __init__(self, send, interval, spill=True):
+        super().__init__(spill)
+        self._send = send
+        self._interval = interval
+        self._pending = []
+        self._last_sent = time.monotonic()
+
+    def write(self, text):
+        written = super().write(text)
+        self._pending.append(text)
+        if time.monotonic() - self._last_sent >= self._interval:
+            self.send_pending()
+        return written
+
+    def send_pending(self):
+        if self._pending:
+            # Cleared before sending so a send that raises doesn't resend
+            text, self._pending = ''.join(self._pending), []
+            self._send(text)
+        self._last_sent = time.monotonic()
+
+
+class _RoutingStream:
+    """Stand-in for sys.stdout/sys.stderr that writes to the running cell's buffer.
+
+    Streamlit runs each session's script in its own thread, and context
+    variables are per thread, so concurrent sessions each see their own
+    buffer. Writes from outside a cell go to the original stream.
+    """
+
+    def __init__(self, target, fallback):
+        self._target = target
+        self._fallback = fallback
+
+    def _current(self):
+        buffer = self._target.get()
+        return buffer if buffer is not None else self._fallback
+
+    def write(self, text):
+        return self._current().write(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        current = self._current()
+        if hasattr(current, 'flush'):
+            current.flush()
+
+    def __getattr__(self, name):
+        # encoding, isatty(), fileno() etc. of whatever is being written to
+        return getattr(self._current(), name)
+
+
+class _CellLogHandler(logging.Handler):
+    """Root logging handler that sends records to the running cell's stderr buffer.
+
+    Outside a cell it stands in for logging's last-resort handler, which
+    stops firing once the root logger has any handler at all.
+    """
+
+    def emit(self, record):
+        buffer = _stderr_target.get()
+        if buffer is not None:
+            try:
+                buffer.write(self.format(record) + '\n')
+            except Exception:
+                self.handleError(record)
+        elif len(logging.getLogger().handlers) == 1 and record.levelno >= logging.lastResort.level:
+            logging.lastResort.handle(record)
+
+
+def install():
+    """Put the routing streams and log handler in place; safe to call repeatedly"""
+    if not isinstance(sys.stdout, _RoutingStream):
+        sys.stdout = _RoutingStream(_stdout_target, sys.stdout)
+    if not isinstance(sys.stderr, _RoutingStream):
+        sys.stderr = _RoutingStream(_stderr_target, sys.stderr)
+    root = logging.getLogger()
+    if not any(isinstance(handler, _CellLogHandler) for handler in root.handlers):
+        root.addHandler(_CellLogHandler())
+
+
+@contextmanager
+def capture_output(stdout_buffer, stderr_buffer):
+    """Route print(), sys.stdout/sys.stderr writes and logging in this context to the given buffers"""
+    install()
+    stdout_token = _stdout_target.set(stdout_buffer)
+    stderr_token = _stderr_target.set(stderr_buffer)
+    try:
+        yield
+    finally:
+        _stderr_target.reset(stderr_token)
+        _stdout_target.reset(stdout_token)
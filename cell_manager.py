@@ -1,11 +1,22 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import numpy as np
-import sys
+import time
+import pickle
+import threading
 import traceback
-from io import StringIO
+from contextlib import contextmanager
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from capture import StreamingBuffer
+from config import STREAM_OUTPUT_INTERVAL
+from compiler import compile_cell
+from dataflow import plan_run, parallel_stages, effective_writes
+from namespace import is_user_name
+from parallel import run_isolated
+from memo import RESULT_FIELDS, fingerprint, memo_key
+from kernel import run_code
+from kernel_worker import get_worker, wait_for_worker, show_running
+
+# Values no cell can change in place; method calls on them never count as writes
+_IMMUTABLE_TYPES = (int, float, complex, bool, str, bytes, type(None), frozenset, range)
 
 
 def add_cell(content="# Write your code here\n", position=None):
@@ -24,29 +35,45 @@ def add_cell(content="# Write your code here\n", position=None):
         'content': content_str,  # Store as string for execution
         'content_list': content_list,  # Store list version for export
         'output': None,
+        'output_spill': None,  # full output in a temp file when 'output' was cut down
         'executed': False,
         'execution_count': None,
         'error': None,
-        'result': None, 
-        'figure': None,  
-        'dataframe': None,  
-        'series': None  
+        'displays': None,  # display.Display records for the result and captured figures (see memo.RESULT_FIELDS)
+        'run_digest': None,  # content hash of the code as last run
+        'run_stamp': None,  # run_counter value when it last ran
+        'memoize': False,
+        'memo_hit': False,
+        'snapshot': False  # keep the namespace as it is after this cell, to rewind to
     }
     if position is None:
         st.session_state.cells.append(new_cell)
     else:
         st.session_state.cells.insert(position, new_cell)
+    # The compact view keeps the newest cell in its window
+    st.session_state.focused_cell = new_cell['id']
     st.session_state.cell_counter += 1
 
 
 def delete_cell(cell_id):
     st.session_state.cells = [c for c in st.session_state.cells if c['id'] != cell_id]
+    st.session_state.result_store.discard(cell_id)
+    st.session_state.snapshots.discard(cell_id)
+    forget_render_caches(cell_id)
+
+
+def forget_render_caches(cell_id):
+    """Drop a cell's cached preview sort orders (a row position per row of its frames)"""
+    orders = st.session_state.get('preview_orders', {})
+    for key in [key for key in orders if key.startswith(f"preview_{cell_id}_")]:
+        del orders[key]
 
 
 def execute_cell(cell_id, code):
     """Execute cell code - handles both string and list input"""
     for cell in st.session_state.cells:
         if cell['id'] == cell_id:
+            compiled = None
             try:
                 # Convert list to string if needed
                 if isinstance(code, list):
@@ -54,86 +81,376 @@ def execute_cell(cell_id, code):
                 else:
                     code_str = code
                 
+                # Parsed once per distinct cell content; raises SyntaxError early
+                compiled = compile_cell(code_str)
+
                 st.session_state.execution_count += 1
                 cell['execution_count'] = st.session_state.execution_count
-                
-                output_buffer = StringIO()
-                error_buffer = StringIO()
-                
-                exec_globals = {
-                    '__builtins__': __builtins__,
-                    'pd': pd,
-                    'np': np,
-                    'px': px,
-                    'go': go,
-                    'st': st,
-                    'df': st.session_state.df,
-                    **st.session_state.variables
-                }
-                
-                def custom_print(*args, **kwargs):
-                    print(*args, file=output_buffer, **kwargs)
-                
-                exec_globals['print'] = custom_print
-                
-                old_stdout = sys.stdout
-                old_stderr = sys.stderr
-                sys.stdout = output_buffer
-                sys.stderr = error_buffer
-                
-                try:
-                    try:
-                        result = eval(code_str, exec_globals)
-                        if result is not None:
-                            if isinstance(result, pd.DataFrame):
-                                cell['dataframe'] = result
-                            elif isinstance(result, pd.Series):
-                                cell['series'] = result
-                            elif isinstance(result, go.Figure) or hasattr(result, '_grid_ref') or (hasattr(result, '__class__') and 'plotly' in str(type(result)).lower()):
-                                cell['figure'] = result
-                            else:
-                                cell['result'] = result
-                    except:
-                        exec(code_str, exec_globals)
-                finally:
-                    sys.stdout = old_stdout
-                    sys.stderr = old_stderr
-                
+                for field in RESULT_FIELDS:
+                    cell[field] = None
+                cell['memo_hit'] = False
+
+                if st.session_state.kernel_mode == 'worker':
+                    # The namespace lives in the worker process; wait for the
+                    # result here (a rerun that interrupts the wait resumes it)
+                    worker = get_worker()
+                    if worker.pending is not None:
+                        finish_worker_run()
+                    worker.submit(cell['id'], code_str, st.session_state.df)
+                    return finish_worker_run()
+
+                namespace = st.session_state.variables
+                # The sidebar may have loaded a new dataset since the last run
+                namespace.inject('df', st.session_state.df)
+
+                memo_entry_key = None
+                if cell.get('memoize'):
+                    memo_entry_key = memo_key(compiled, namespace, write_stamps())
+                    entry = st.session_state.result_memo.get(memo_entry_key)
+                    if entry is not None:
+                        # Same code, same inputs: replay instead of running
+                        cell.update(entry['fields'])
+                        for name, value in entry['bindings'].items():
+                            namespace[name] = value
+                        if 'df' in entry['bindings']:
+                            st.session_state.df = namespace['df']
+                        cell['memo_hit'] = True
+                        _finish_run(cell, compiled)
+                        return True, None
+
+                # Snapshots sharing what the cell may change in place get their own copy first
+                st.session_state.snapshots.before_run(namespace, compiled.reads)
+                cell.update(_run_inline(namespace, compiled))
+
                 # Update df in session state
-                if 'df' in exec_globals:
-                    st.session_state.df = exec_globals['df']
-
-                # Auto-capture any figures created in the code
-                for key, value in exec_globals.items():
-                    if isinstance(value, go.Figure):
-                        cell['figure'] = value
-                        break
-                    elif hasattr(value, '_grid_ref') or (hasattr(value, '__class__') and 'plotly' in str(type(value)).lower()):
-                        cell['figure'] = value
-                        break
-                
-                # Update variables
-                excluded_keys = {'pd', 'np', 'px', 'go', 'st', '__builtins__', 'print', '__name__', '__doc__', '__package__', '__loader__', '__spec__', '__annotations__', '__file__', '__cached__'}
-                for key, value in exec_globals.items():
-                    if key not in excluded_keys and not key.startswith('_'):
-                        st.session_state.variables[key] = value
-                
-                captured_output = output_buffer.getvalue()
-                captured_errors = error_buffer.getvalue()
-                
-                full_output = captured_output + captured_errors if captured_errors else captured_output
-                cell['output'] = full_output if full_output else None
-                cell['executed'] = True
-                cell['error'] = None
-                
+                if 'df' in namespace.changed:
+                    st.session_state.df = namespace['df']
+
+                if memo_entry_key is not None:
+                    st.session_state.result_memo.put(
+                        memo_entry_key,
+                        {field: cell[field] for field in RESULT_FIELDS},
+                        # Replaying has to redo the cell's in-place changes too
+                        {name: namespace[name] for name in compiled.writes | compiled.mutates if name in namespace}
+                    )
+
+                _finish_run(cell, compiled)
                 return True, None
                 
             except Exception as e:
-                error_traceback = traceback.format_exc()
-                cell['output'] = None
-                cell['error'] = str(e)
-                cell['error_traceback'] = error_traceback
-                cell['executed'] = False
-                cell['execution_count'] = None
+                _record_error(cell, compiled, str(e), traceback.format_exc())
                 return False, str(e)
+            except BaseException:
+                # Streamlit stopped the script mid-cell (the user clicked
+                # something while output was streaming), or KeyboardInterrupt
+                _record_error(cell, compiled, "Interrupted", traceback.format_exc())
+                raise
     return False, "Cell not found"
+
+
+def _run_inline(namespace, compiled):
+    """run_code, streaming the output to the page while the cell runs if enabled"""
+    if not st.session_state.stream_output:
+        return run_code(namespace, compiled)
+
+    live = st.empty()
+    started = time.monotonic()
+    lock = threading.Lock()
+
+    def refresh(_=None):
+        with lock:
+            show_running(live, started, output_buffer.getvalue())
+
+    output_buffer = StreamingBuffer(refresh, STREAM_OUTPUT_INTERVAL)
+    refresh()
+    try:
+        # Writes refresh the status as they come; the ticker keeps the
+        # elapsed time going while the cell is silent
+        with _ticking(refresh, STREAM_OUTPUT_INTERVAL):
+            return run_code(namespace, compiled, output_buffer)
+    finally:
+        live.empty()
+
+
+@contextmanager
+def _ticking(callback, interval):
+    """Call callback every interval seconds from a helper thread while the block runs"""
+    stop = threading.Event()
+
+    def tick():
+        while not stop.wait(interval):
+            callback()
+
+    thread = threading.Thread(target=tick, name='notebook-status', daemon=True)
+    # So its page updates go to this session
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def finish_worker_run():
+    """Wait for the worker's pending cell and apply its result to that cell"""
+    worker = get_worker()
+    if worker.pending is None:
+        return False, "Nothing running"
+
+    response = wait_for_worker(worker)
+    cell = next((c for c in st.session_state.cells if c['id'] == response['cell_id']), None)
+    if cell is None:
+        return False, "Cell not found"
+
+    compiled = compile_cell(response['code'])
+    if response['error'] is not None:
+        _record_error(cell, compiled, response['error'], response['error_traceback'])
+        return False, response['error']
+
+    cell.update(response['fields'])
+    if 'df' in response:
+        st.session_state.df = response['df']
+    _finish_run(cell, compiled)
+    return True, None
+
+
+def _record_error(cell, compiled, message, error_traceback):
+    # The cell stays stale, so its re-run also re-runs what depends on it
+    cell['run_digest'] = None
+    cell['output'] = None
+    cell['output_spill'] = None
+    st.session_state.result_store.discard(cell['id'])
+    cell['error'] = message
+    cell['error_traceback'] = error_traceback
+    cell['executed'] = False
+    cell['execution_count'] = None
+
+
+def _finish_run(cell, compiled):
+    """Record a successful run for the incremental scheduler"""
+    cell['executed'] = True
+    cell['error'] = None
+    cell['run_digest'] = compiled.digest
+    cell['run_stamp'] = _next_stamp()
+    st.session_state.result_store.put(cell['id'], cell['displays'])
+    if cell.get('snapshot') and st.session_state.kernel_mode != 'worker':
+        st.session_state.snapshots.take(cell['id'], cell['run_stamp'], st.session_state.variables)
+
+
+def _next_stamp():
+    st.session_state.run_counter += 1
+    return st.session_state.run_counter
+
+
+def drop_variable(name):
+    """Delete a variable from the inline kernel's namespace to free its memory; cells reading it go stale"""
+    namespace = st.session_state.variables
+    if name not in namespace:
+        return
+    st.session_state.result_memo.discard_holding(namespace[name])
+    del namespace[name]
+    if name == 'df':
+        # Otherwise the next run injects the dataset again
+        st.session_state.df = None
+    mark_changed([name])
+
+
+def drop_cell_result(cell_id):
+    """Forget a cell's displayed result and output; the cell runs again on the next Run All"""
+    for cell in st.session_state.cells:
+        if cell['id'] == cell_id:
+            st.session_state.result_memo.discard_holding(cell['displays'])
+            st.session_state.result_store.discard(cell_id)
+            forget_render_caches(cell_id)
+            for field in RESULT_FIELDS:
+                cell[field] = None
+            cell['executed'] = False
+            cell['run_digest'] = None
+            cell['memo_hit'] = False
+
+
+def can_rewind(cell_id):
+    """Whether the cell has a snapshot that still matches the notebook above it.
+
+    It doesn't once the cell or a cell above it has run again since, or
+    something outside the notebook (an upload) changed a variable.
+    """
+    stamp = st.session_state.snapshots.stamp(cell_id)
+    if stamp is None:
+        return False
+    if any(changed > stamp for changed in st.session_state.external_writes.values()):
+        return False
+    for cell in st.session_state.cells:
+        if (cell['run_stamp'] or 0) > stamp:
+            return False
+        if cell['id'] == cell_id:
+            return cell['run_stamp'] == stamp
+    return False
+
+
+def rewind_to(cell_id):
+    """Put the namespace back to its state right after the cell ran; the cells below it go stale"""
+    namespace = st.session_state.snapshots.restore(cell_id)
+    st.session_state.variables = namespace
+    st.session_state.df = namespace.get('df')
+    below = False
+    for cell in st.session_state.cells:
+        if below:
+            cell['run_digest'] = None
+            # They describe states that no longer follow from this one
+            st.session_state.snapshots.discard(cell['id'])
+        below = below or cell['id'] == cell_id
+
+
+def mark_changed(names):
+    """Record names changed from outside the notebook (e.g. a new upload) so cells reading them go stale"""
+    stamp = _next_stamp()
+    for name in names:
+        st.session_state.external_writes[name] = stamp
+
+
+def run_all(force=False, parallel=False):
+    """Run the notebook top to bottom.
+
+    Unless force is set, only cells whose code changed, that never ran or
+    errored, or that read a name changed upstream are executed. With
+    parallel set (inline kernel only), independent cells run concurrently
+    in worker processes.
+    """
+    cells = list(st.session_state.cells)
+    compiled_cells = _compile_all(cells)
+    mutable = _mutable_names(compiled_cells)
+    if force:
+        plan = cells
+    else:
+        plan = plan_run(cells, compiled_cells, st.session_state.external_writes, mutable)
+
+    if parallel and st.session_state.kernel_mode != 'worker':
+        compiled_by_id = {cell['id']: compiled for cell, compiled in zip(cells, compiled_cells)}
+        _run_parallel(plan, [compiled_by_id[cell['id']] for cell in plan], mutable)
+    else:
+        for cell in plan:
+            execute_cell(cell['id'], cell['content'])
+    return plan
+
+
+def _compile_all(cells):
+    """CompiledCell per cell, None for code that doesn't parse"""
+    compiled_cells = []
+    for cell in cells:
+        try:
+            compiled_cells.append(compile_cell(cell['content']))
+        except SyntaxError:
+            compiled_cells.append(None)
+    return compiled_cells
+
+
+def write_stamps():
+    """Newest run stamp of a write to each name, from the notebook and from outside it.
+
+    Method calls that may have changed a name in place count as writes.
+    """
+    stamps = dict(st.session_state.external_writes)
+    compiled_cells = _compile_all(st.session_state.cells)
+    mutable = _mutable_names(compiled_cells)
+    for cell, compiled in zip(st.session_state.cells, compiled_cells):
+        if cell.get('run_stamp') is None or compiled is None:
+            continue
+        for name in effective_writes(compiled, mutable):
+            stamps[name] = max(stamps.get(name, 0), cell['run_stamp'])
+    return stamps
+
+
+def _mutable_names(compiled_cells):
+    """User names whose value a method call may change in place.
+
+    What the cells bind isn't known until they run, so those names count too.
+    """
+    mutable = {name for name, value in st.session_state.variables.user_items() if not isinstance(value, _IMMUTABLE_TYPES)}
+    if st.session_state.df is not None:
+        mutable.add('df')
+    for compiled in compiled_cells:
+        if compiled is not None:
+            mutable |= {name for name in compiled.writes if is_user_name(name)}
+    return frozenset(mutable)
+
+
+def _pickle_inputs(compiled, namespace, pickled):
+    """Pickled values of the user names a cell reads, or None if any can't be pickled"""
+    inputs = {}
+    for name in compiled.reads:
+        if name not in namespace or not is_user_name(name):
+            continue
+        if name not in pickled:
+            try:
+                pickled[name] = pickle.dumps(namespace[name], protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                pickled[name] = None
+        if pickled[name] is None:
+            return None
+        inputs[name] = pickled[name]
+    return inputs
+
+
+def _fingerprint_inputs(compiled, namespace):
+    return {name: fingerprint(namespace[name]) for name in compiled.reads if name in namespace and is_user_name(name)}
+
+
+def _apply_isolated(cell, compiled, response):
+    """Merge a parallel run's fields and bindings into the session"""
+    st.session_state.execution_count += 1
+    cell['execution_count'] = st.session_state.execution_count
+    cell['memo_hit'] = False
+    if response['error'] is not None:
+        for field in RESULT_FIELDS:
+            cell[field] = None
+        _record_error(cell, compiled, response['error'], response['error_traceback'])
+        return
+
+    namespace = st.session_state.variables
+    cell.update(response['fields'])
+    for name, data in response['bindings'].items():
+        namespace[name] = pickle.loads(data)
+    if 'df' in response['bindings']:
+        st.session_state.df = namespace['df']
+    _finish_run(cell, compiled)
+
+
+def _run_parallel(plan, compiled_cells, mutable):
+    namespace = st.session_state.variables
+    namespace.inject('df', st.session_state.df)
+
+    for stage in parallel_stages(plan, compiled_cells, mutable):
+        # Inputs are pickled once per stage and shared by every task reading them
+        pickled = {}
+        tasks = {}
+        if len(stage) > 1:
+            for cell, compiled in stage:
+                inputs = _pickle_inputs(compiled, namespace, pickled) if compiled is not None else None
+                if inputs is not None:
+                    tasks[cell['id']] = inputs
+        responses = run_isolated([
+            (cell['id'], cell['content'], tasks[cell['id']]) for cell, _ in stage if cell['id'] in tasks
+        ]) if tasks else []
+        by_id = {response['cell_id']: response for response in responses}
+
+        # Merge in notebook order; cells that couldn't be shipped run here.
+        # A cell that read a value an earlier cell of the stage changed in
+        # place (which the name analysis missed) saw the old value, so it
+        # runs again here, after that change
+        changed = set()
+        for cell, compiled in stage:
+            response = by_id.get(cell['id'])
+            if response is None or response['rerun'] or (compiled is not None and compiled.reads & changed):
+                before = _fingerprint_inputs(compiled, namespace) if compiled is not None else {}
+                execute_cell(cell['id'], cell['content'])
+                changed |= compiled.writes if compiled is not None else set()
+                changed |= {
+                    name for name, digest in before.items()
+                    # Values fingerprinted by identity can't be checked
+                    if name not in namespace or digest[0] == 'id' or fingerprint(namespace[name]) != digest
+                }
+            else:
+                _apply_isolated(cell, compiled, response)
+                changed |= set(response['bindings'])
@@ -0,0 +1,160 @@
+"""Chart helpers that aggregate on the server and send plotly only the summary.
+
+Available in cells as `charts`. Unlike px.histogram / px.box / px.bar,
+which embed every row in the figure and bin or aggregate in the browser,
+these compute bins, quartiles and group aggregates with NumPy/pandas, so
+the figure's size doesn't grow with the number of rows.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from config import CHART_MAX_CATEGORIES, CHART_MAX_OUTLIERS
+
+
+def _frame(data, column):
+    """(frame, column) for a DataFrame plus column name, or for a bare Series/array"""
+    if column is not None:
+        return data, column
+    series = pd.Series(data)
+    name = series.name if series.name is not None else 'value'
+    return series.to_frame(name), name
+
+
+def _groups(data, column, by):
+    """(name, values) pairs, one per `by` group, or a single unnamed group"""
+    if by is None:
+        return [(None, data[column])]
+    return [
+        (str(name), group[column])
+        for name, group in data.groupby(by, observed=True, sort=True)
+    ][:CHART_MAX_CATEGORIES]
+
+
+def _as_float(values):
+    """Finite float values of a numeric or datetime series; datetimes become ns since the epoch"""
+    values = values.dropna()
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = values.dt.as_unit('ns').astype('int64')
+    values = values.to_numpy(dtype=float)
+    return values[np.isfinite(values)]
+
+
+def histogram(data, column=None, bins=30, color=None, title=None):
+    """Histogram of a numeric or date column with bins counted server-side.
+
+    All color groups share one set of bin edges. Text columns fall back to
+    a bar chart of the most common values.
+    """
+    data, column = _frame(data, column)
+    values = data[column]
+    is_dates = pd.api.types.is_datetime64_any_dtype(values)
+    if not (is_dates or pd.api.types.is_numeric_dtype(values)) or pd.api.types.is_bool_dtype(values):
+        return bar(data, column, color=color, title=title)
+
+    edges = np.histogram_bin_edges(_as_float(values), bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+    if is_dates:
+        centers = pd.to_datetime(centers, unit='ns', utc=values.dt.tz is not None).round('ms')
+        if values.dt.tz is not None:
+            centers = centers.tz_convert(values.dt.tz)
+        # plotly measures date bar widths in milliseconds
+        widths = widths / 1e6
+
+    fig = go.Figure()
+    for name, group in _groups(data, column, color):
+        counts, _ = np.histogram(_as_float(group), bins=edges)
+        fig.add_trace(go.Bar(
+            x=centers,
+            y=counts,
+            width=widths,
+            name=name,
+            showlegend=name is not None,
+            opacity=0.75 if color is not None else None
+        ))
+    fig.update_layout(
+        title=title,
+        barmode='overlay',
+        bargap=0,
+        xaxis_title=column,
+        yaxis_title='count'
+    )
+    return fig
+
+
+def box(data, y=None, x=None, title=None):
+    """Box plot with quartiles and whiskers computed server-side.
+
+    Whiskers reach the furthest points within 1.5 IQR of the box. At most
+    CHART_MAX_OUTLIERS points beyond them are drawn per box, the most
+    extreme ones first.
+    """
+    data, y = _frame(data, y)
+
+    stats = {'name': [], 'q1': [], 'median': [], 'q3': [], 'lowerfence': [], 'upperfence': [], 'mean': []}
+    outlier_x, outlier_y = [], []
+    for name, group in _groups(data, y, x):
+        group = _as_float(group)
+        if not len(group):
+            continue
+        q1, median, q3 = np.percentile(group, [25, 50, 75])
+        iqr = q3 - q1
+        inside = group[(group >= q1 - 1.5 * iqr) & (group <= q3 + 1.5 * iqr)]
+        label = name if name is not None else str(y)
+        stats['name'].append(label)
+        stats['q1'].append(q1)
+        stats['median'].append(median)
+        stats['q3'].append(q3)
+        stats['lowerfence'].append(inside.min())
+        stats['upperfence'].append(inside.max())
+        stats['mean'].append(group.mean())
+
+        outliers = group[(group < inside.min()) | (group > inside.max())]
+        if len(outliers) > CHART_MAX_OUTLIERS:
+            outliers = outliers[np.argsort(-np.abs(outliers - median))[:CHART_MAX_OUTLIERS]]
+        outlier_x.extend([label] * len(outliers))
+        outlier_y.extend(outliers.tolist())
+
+    fig = go.Figure(go.Box(
+        x=stats.pop('name'),
+        **stats,
+        boxpoints=False,
+        showlegend=False
+    ))
+    if outlier_y:
+        fig.add_trace(go.Scatter(x=outlier_x, y=outlier_y, mode='markers', name='outliers', showlegend=False))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+def bar(data, x, y=None, agg='mean', color=None, title=None):
+    """Bar chart of y aggregated per x (and color) group server-side.
+
+    agg is any pandas aggregation name ('mean', 'sum', 'median', ...).
+    Without y the bars count rows. Only the CHART_MAX_CATEGORIES largest
+    groups are drawn.
+    """
+    keys = [x] if color is None else [x, color]
+    grouped = data.groupby(keys, observed=True)
+    if y is None:
+        summary = grouped.size().rename('count')
+        y_title = 'count'
+    else:
+        summary = grouped[y].agg(agg)
+        y_title = f"{agg} of {y}"
+
+    # Keep the biggest x groups so the figure stays small
+    totals = summary.groupby(level=0).sum() if color is not None else summary
+    top = totals.abs().nlargest(CHART_MAX_CATEGORIES).index
+    summary = summary[summary.index.get_level_values(0).isin(top)] if color is not None else summary.loc[top]
+
+    fig = go.Figure()
+    if color is None:
+        summary = summary.sort_index()
+        fig.add_trace(go.Bar(x=summary.index.astype(str), y=summary.to_numpy()))
+    else:
+        for name, group in summary.groupby(level=1, sort=True):
+            group = group.droplevel(1).sort_index()
+            fig.add_trace(go.Bar(x=group.index.astype(str), y=group.to_numpy(), name=str(name)))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y_title, barmode='group')
+    return fig
@@ -0,0 +1,201 @@
+"""Save a session's notebook, namespace and results to disk, and restore them without re-running.
+
+A checkpoint is a directory holding state.pkl and one buffers file. The
+state is pickled with protocol 5, with the data buffers of NumPy arrays
+(and so of pandas frames) written out-of-band to the buffers file. On
+restore the buffers file is memory-mapped copy-on-write and the arrays
+are rebuilt on top of it, so restoring takes about as long as unpickling
+the small objects; array data is paged in as it's used.
+"""
+import io
+import os
+import re
+import mmap
+import time
+import uuid
+import pickle
+import streamlit as st
+from capture import _remove_file
+from compiler import compile_cell
+from config import CHECKPOINT_DIR, CHECKPOINT_MAX_AGE_DAYS
+from namespace import new_namespace
+from results import SpilledValue
+
+# Session state saved alongside the namespace
+_STATE_KEYS = (
+    'cells', 'cell_counter', 'execution_count', 'run_counter', 'external_writes', 'df',
+    'dataset_key', 'dataset_shape', 'dataset_columns', 'dataset_report', 'file_loaded'
+)
+_ALIGNMENT = 64
+_VALID_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Widget keys that hold a cell's code and options; the widget value wins over the cell dict
+_CELL_WIDGET_PREFIXES = ('code_', 'memo_', 'snapshot_')
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """Writes spilled results into the checkpoint instead of their temp file paths"""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, SpilledValue):
+            return _identity, (obj.load(),)
+        return NotImplemented
+
+
+def _identity(value):
+    return value
+
+
+def checkpoint_path(name):
+    if not _VALID_NAME.match(name or ''):
+        raise ValueError(f"Invalid checkpoint name: {name!r}")
+    return os.path.join(CHECKPOINT_DIR, name)
+
+
+def checkpoint_exists(name):
+    try:
+        return os.path.exists(os.path.join(checkpoint_path(name), 'state.pkl'))
+    except ValueError:
+        return False
+
+
+def _dump(state, buffers_file):
+    """Pickle state, writing out-of-band buffers to buffers_file; returns (pickle bytes, buffer spans)"""
+    spans = []
+
+    def write_buffer(buffer):
+        data = buffer.raw()
+        offset = -buffers_file.tell() % _ALIGNMENT
+        buffers_file.write(b'\0' * offset)
+        spans.append((buffers_file.tell(), data.nbytes))
+        buffers_file.write(data)
+
+    data = io.BytesIO()
+    _CheckpointPickler(data, protocol=5, buffer_callback=write_buffer).dump(state)
+    return data.getvalue(), spans
+
+
+def unpicklable_names(variables):
+    """Names of the variables that can't be pickled"""
+    names = []
+    for name, value in variables.items():
+        try:
+            pickle.dumps(value, protocol=5, buffer_callback=lambda buffer: None)
+        except Exception:
+            names.append(name)
+    return names
+
+
+def _writes(cell):
+    try:
+        return compile_cell(cell['content']).writes
+    except SyntaxError:
+        return set()
+
+
+def write_state(path, state):
+    """Pickle a dict of state into the directory path, replacing what was saved there"""
+    os.makedirs(path, exist_ok=True)
+    buffers_name = f"buffers-{uuid.uuid4().hex}.bin"
+    buffers_path = os.path.join(path, buffers_name)
+    try:
+        with open(buffers_path, 'wb') as buffers_file:
+            data, spans = _dump(state, buffers_file)
+        with open(os.path.join(path, 'state.pkl.tmp'), 'wb') as f:
+            pickle.dump({'buffers': buffers_name, 'spans': spans, 'state': data}, f, protocol=5)
+        # The new state only replaces the old one once it's complete
+        os.replace(os.path.join(path, 'state.pkl.tmp'), os.path.join(path, 'state.pkl'))
+    except BaseException:
+        _remove_file(buffers_path)
+        raise
+
+    # Restored sessions may still map an old buffers file; unlinking it
+    # leaves their mapping intact
+    for entry in os.listdir(path):
+        if entry.startswith('buffers-') and entry != buffers_name:
+            _remove_file(os.path.join(path, entry))
+
+
+def read_state(path):
+    """The state saved by write_state, with array data memory-mapped from the buffers file"""
+    with open(os.path.join(path, 'state.pkl'), 'rb') as f:
+        saved = pickle.load(f)
+
+    buffers = []
+    if saved['spans']:
+        with open(os.path.join(path, saved['buffers']), 'rb') as f:
+            # Copy-on-write, so restored arrays are writable without touching the file
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(mapped)
+        buffers = [view[offset:offset + size] for offset, size in saved['spans']]
+    return pickle.loads(saved['state'], buffers=buffers)
+
+
+def save_checkpoint(name):
+    """Write the session to the named checkpoint, replacing it; returns the variables that couldn't be saved"""
+    path = checkpoint_path(name)
+    delete_old_checkpoints()
+    state = {key: st.session_state[key] for key in _STATE_KEYS}
+    # The full text of long outputs lives in temp files; keep the cut-down text
+    state['cells'] = [dict(cell, output_spill=None) for cell in state['cells']]
+    state['variables'] = dict(st.session_state.variables.user_items())
+    try:
+        write_state(path, state)
+        return []
+    except Exception:
+        # Leave out the variables that can't be pickled (open files,
+        # generators, ...); the cells binding them run again after a restore
+        skipped = unpicklable_names(state['variables'])
+        if not skipped:
+            raise
+    for name in skipped:
+        del state['variables'][name]
+    for cell in state['cells']:
+        if _writes(cell) & set(skipped):
+            cell['run_digest'] = None
+    write_state(path, state)
+    return skipped
+
+
+def restore_checkpoint(name):
+    """Replace the session's notebook and namespace with the named checkpoint"""
+    state = read_state(checkpoint_path(name))
+    namespace = new_namespace()
+    for variable, value in state.pop('variables').items():
+        namespace.inject(variable, value)
+    for key, value in state.items():
+        st.session_state[key] = value
+    st.session_state.variables = namespace
+    # Otherwise the editors keep showing (and the cells keep) the replaced code
+    for key in list(st.session_state.keys()):
+        if key.startswith(_CELL_WIDGET_PREFIXES):
+            del st.session_state[key]
+
+    # Caches built for the replaced cells
+    st.session_state.result_memo.clear()
+    st.session_state.result_store.clear()
+    st.session_state.snapshots.clear()
+    for cell in st.session_state.cells:
+        if cell['executed']:
+            st.session_state.result_store.put(cell['id'], cell['displays'])
+
+
+def delete_checkpoint(name):
+    path = checkpoint_path(name)
+    for entry in os.listdir(path):
+        _remove_file(os.path.join(path, entry))
+    os.rmdir(path)
+
+
+def delete_old_checkpoints():
+    """Delete the checkpoints last saved more than CHECKPOINT_MAX_AGE_DAYS ago"""
+    cutoff = time.time() - CHECKPOINT_MAX_AGE_DAYS * 24 * 3600
+    try:
+        names = os.listdir(CHECKPOINT_DIR)
+    except OSError:
+        return
+    for name in names:
+        try:
+            if os.path.getmtime(os.path.join(checkpoint_path(name), 'state.pkl')) < cutoff:
+                delete_checkpoint(name)
+        except (OSError, ValueError):
+            continue
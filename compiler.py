@@ -0,0 +1,63 @@
+import ast
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from config import CODE_CACHE_MAX_ENTRIES
+from dataflow import analyze_names
+
+# body: code object for every statement but a trailing expression (or None)
+# expr: code object for the trailing expression to display (or None)
+# reads/writes: global names the cell uses and (re)binds or mutates
+# mutates: names a method call in the cell may change in place (see dataflow)
+CompiledCell = namedtuple('CompiledCell', ['digest', 'body', 'expr', 'reads', 'writes', 'mutates'])
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def code_digest(code_str):
+    """Content hash used to key compiled cells"""
+    return hashlib.blake2b(code_str.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _split_cell(code_str, tree):
+    """Split a module into (statements, trailing expression) the way IPython does"""
+    if not tree.body or not isinstance(tree.body[-1], ast.Expr):
+        return tree, None
+
+    last = tree.body[-1]
+    # A trailing semicolon suppresses the displayed value, like in Jupyter
+    # (end_col_offset counts UTF-8 bytes, not characters)
+    line = code_str.splitlines()[last.end_lineno - 1].encode('utf-8')
+    if line[last.end_col_offset:].lstrip().startswith(b';'):
+        return tree, None
+
+    body = ast.Module(body=tree.body[:-1], type_ignores=[])
+    expr = ast.Expression(body=last.value)
+    return body, expr
+
+
+def compile_cell(code_str):
+    """Parse and compile a cell once, reusing the code objects on later runs.
+
+    Raises SyntaxError for invalid code, same as compile().
+    """
+    digest = code_digest(code_str)
+    with _lock:
+        compiled = _cache.get(digest)
+        if compiled is not None:
+            _cache.move_to_end(digest)
+            return compiled
+
+    tree = ast.parse(code_str, filename='<cell>', mode='exec')
+    body_tree, expr_tree = _split_cell(code_str, tree)
+    body = compile(body_tree, '<cell>', 'exec') if body_tree.body else None
+    expr = compile(expr_tree, '<cell>', 'eval') if expr_tree is not None else None
+    reads, writes, mutates = analyze_names(tree)
+    compiled = CompiledCell(digest, body, expr, reads, writes, mutates)
+
+    with _lock:
+        _cache[digest] = compiled
+        while len(_cache) > CODE_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return compiled
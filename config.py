@@ -1,3 +1,5 @@
+import os
+import tempfile
 import streamlit as st
 
 CUSTOM_CSS = """
@@ -341,6 +343,94 @@ CUSTOM_CSS = """
 </script>
 """
 
+# Parsed upload cache (shared by all sessions in the server process)
+DATASET_CACHE_MAX_ENTRIES = 8
+DATASET_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# CSVs larger than this are streamed in chunks of CSV_CHUNK_ROWS rows by default
+CSV_CHUNKED_THRESHOLD_BYTES = 50 * 1024 ** 2
+CSV_CHUNK_ROWS = 100_000
+
+# Text columns with at most this ratio of unique values become categories when compacting
+COMPACT_CATEGORY_MAX_RATIO = 0.5
+
+# Compiled cell code objects kept in memory, keyed by cell content hash
+CODE_CACHE_MAX_ENTRIES = 512
+
+# Per-session memo of results for cells with "Cache result" turned on
+MEMO_MAX_ENTRIES = 64
+MEMO_MAX_BYTES = 512 * 1024 ** 2
+# Frames/arrays up to this many rows are fingerprinted in full, larger ones by a row sample
+MEMO_FULL_HASH_MAX_ROWS = 200_000
+MEMO_SAMPLE_ROWS = 10_000
+# Containers up to this many items are fingerprinted in full, larger ones by length and an item sample
+MEMO_FULL_HASH_MAX_ITEMS = 1000
+MEMO_SAMPLE_ITEMS = 1000
+
+# Kernel worker process: how often the UI polls it and how often it streams stdout back
+WORKER_POLL_INTERVAL = 0.25
+WORKER_STREAM_INTERVAL = 0.2
+
+# Output of a running cell: how often the page is updated with it (inline
+# kernel) and how much of its tail is shown
+STREAM_OUTPUT_INTERVAL = 0.5
+RUNNING_PREVIEW_CHARS = 5_000
+
+# Cell output kept in memory: the first and last this many characters. Longer
+# output is spilled in full to a temp file and paged through in slices
+OUTPUT_HEAD_CHARS = 20_000
+OUTPUT_TAIL_CHARS = 80_000
+OUTPUT_PAGE_BYTES = 64 * 1024
+
+# Notebooks with at least NOTEBOOK_COMPACT_MIN_CELLS cells render only a window
+# of this many cells in full; the rest show as one-line summaries
+NOTEBOOK_COMPACT_MIN_CELLS = 30
+NOTEBOOK_WINDOW_CELLS = 15
+
+# Result frames are previewed PREVIEW_PAGE_ROWS rows at a time ("Load more" adds
+# a page, up to PREVIEW_MAX_ROWS), with at most PREVIEW_MAX_COLUMNS columns preselected
+PREVIEW_PAGE_ROWS = 100
+PREVIEW_MAX_ROWS = 5_000
+PREVIEW_MAX_COLUMNS = 50
+
+# Line/scatter traces with more points than FIGURE_WEBGL_POINTS are drawn with
+# WebGL, and downsampled to FIGURE_MAX_POINTS when larger than that
+FIGURE_WEBGL_POINTS = 5_000
+FIGURE_MAX_POINTS = 20_000
+
+# Longest repr() shown for a cell's result value
+DISPLAY_REPR_CHARS = 10_000
+
+# charts helpers: most categories/groups drawn, and outliers drawn per box
+CHART_MAX_CATEGORIES = 50
+CHART_MAX_OUTLIERS = 200
+
+# Values shown by cell outputs kept in memory per session; beyond the budget the
+# least recently shown ones (each at least RESULT_SPILL_MIN_BYTES) go to temp files
+RESULT_MEMORY_BUDGET = 256 * 1024 ** 2
+RESULT_SPILL_MIN_BYTES = 1024 ** 2
+
+# Largest variables/cell results listed by the sidebar memory inspector
+MEMORY_INSPECTOR_ROWS = 30
+
+# Memory the per-cell namespace snapshots ("Snapshot" cells) may hold on to
+# beyond what the live namespace shares with them
+SNAPSHOT_MAX_BYTES = 1024 ** 3
+
+# Saved sessions ("checkpoints"), one directory each; ones not saved again within
+# CHECKPOINT_MAX_AGE_DAYS are deleted when another checkpoint is saved
+CHECKPOINT_DIR = os.environ.get('NOTEBOOK_CHECKPOINT_DIR', os.path.join(os.path.expanduser('~'), '.notebook_checkpoints'))
+CHECKPOINT_MAX_AGE_DAYS = float(os.environ.get('NOTEBOOK_CHECKPOINT_MAX_AGE_DAYS', 30))
+
+# Sessions idle this long have their variables and results moved to disk until
+# they're used again; the check runs every HIBERNATE_CHECK_SECONDS
+HIBERNATE_IDLE_MINUTES = float(os.environ.get('NOTEBOOK_HIBERNATE_MINUTES', 30))
+HIBERNATE_CHECK_SECONDS = 60
+HIBERNATE_DIR = os.path.join(tempfile.gettempdir(), 'notebook-hibernate')
+
+# Worker processes shared by all sessions for parallel Run All
+PARALLEL_MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
 
 def setup_page_config():
     """Configure Streamlit page settings"""
@@ -363,11 +453,57 @@ def initialize_session_state():
     if 'cell_counter' not in st.session_state:
         st.session_state.cell_counter = 1
     if 'variables' not in st.session_state:
-        st.session_state.variables = {}
+        from namespace import new_namespace
+        st.session_state.variables = new_namespace()
     if 'file_loaded' not in st.session_state:
         st.session_state.file_loaded = False
     if 'execution_count' not in st.session_state:
         st.session_state.execution_count = 0
+    if 'dataset_key' not in st.session_state:
+        st.session_state.dataset_key = None
+    if 'dataset_shape' not in st.session_state:
+        st.session_state.dataset_shape = None
+    if 'dataset_columns' not in st.session_state:
+        st.session_state.dataset_columns = []
+    if 'ingest_cancelled' not in st.session_state:
+        st.session_state.ingest_cancelled = None
+    if 'dataset_report' not in st.session_state:
+        st.session_state.dataset_report = None
+    if 'run_counter' not in st.session_state:
+        st.session_state.run_counter = 0
+    if 'external_writes' not in st.session_state:
+        st.session_state.external_writes = {}
+    if 'kernel_mode' not in st.session_state:
+        st.session_state.kernel_mode = 'inline'
+    if 'kernel_worker' not in st.session_state:
+        st.session_state.kernel_worker = None
+    if 'focused_cell' not in st.session_state:
+        st.session_state.focused_cell = None
+    # Off by default: while streaming, a click on the page stops the running cell partway
+    if 'stream_output' not in st.session_state:
+        st.session_state.stream_output = False
+    if 'parallel_run_all' not in st.session_state:
+        st.session_state.parallel_run_all = False
+    if 'result_memo' not in st.session_state:
+        from memo import ResultMemo
+        st.session_state.result_memo = ResultMemo(MEMO_MAX_ENTRIES, MEMO_MAX_BYTES)
+    if 'snapshots' not in st.session_state:
+        from snapshots import SnapshotStore
+        st.session_state.snapshots = SnapshotStore(SNAPSHOT_MAX_BYTES)
+    if 'hibernation' not in st.session_state:
+        st.session_state.hibernation = {
+            'asleep': False, 'hibernated_at': None, 'woke_at': None, 'wake_seconds': None, 'count': 0
+        }
+    if 'checkpoint_name' not in st.session_state:
+        st.session_state.checkpoint_name = None
+    if 'result_store' not in st.session_state:
+        from results import ResultStore
+        from cell_manager import forget_render_caches
+        st.session_state.result_store = ResultStore(
+            RESULT_MEMORY_BUDGET,
+            shared=lambda: [value for _, value in st.session_state.variables.user_items()],
+            on_spill=forget_render_caches
+        )
 
 
 CODE_TEMPLATES = {
@@ -631,7 +767,7 @@ CODE_TEMPLATES = {
                 "             x='category_column',",
                 "             y='value_column',",
                 "             title='My Bar Chart')",
-                "st.plotly_chart(fig, use_container_width=True)"
+                "fig"
             ],
             "description": "Compare values across categories"
         },
@@ -643,7 +779,7 @@ CODE_TEMPLATES = {
                 "              x='date_column',",
                 "              y='value_column',",
                 "              title='Trend Over Time')",
-                "st.plotly_chart(fig, use_container_width=True)"
+                "fig"
             ],
             "description": "Show trends and changes over time"
         },
@@ -655,7 +791,7 @@ CODE_TEMPLATES = {
                 "                 x='column1',",
                 "                 y='column2',",
                 "                 title='Relationship Between Two Variables')",
-                "st.plotly_chart(fig, use_container_width=True)"
+                "fig"
             ],
             "description": "Explore relationships between two numbers"
         },
@@ -667,7 +803,7 @@ CODE_TEMPLATES = {
                 "                   x='column_name',",
                 "                   nbins=30,",
                 "                   title='Distribution of Values')",
-                "st.plotly_chart(fig, use_container_width=True)"
+                "fig"
             ],
             "description": "See how values are distributed"
         },
@@ -679,7 +815,7 @@ CODE_TEMPLATES = {
                 "fig = px.pie(values=value_counts.values,",
                 "             names=value_counts.index,",
                 "             title='Distribution by Category')",
-                "st.plotly_chart(fig, use_container_width=True)"
+                "fig"
             ],
             "description": "Show proportions and percentages"
         },
@@ -690,9 +826,46 @@ CODE_TEMPLATES = {
                 "fig = px.box(df,",
                 "             y='column_name',",
                 "             title='Box Plot')",
-                "st.plotly_chart(fig, use_container_width=True)"
+                "fig"
             ],
             "description": "Identify outliers and data spread"
+        },
+        "Histogram (large data)": {
+            "code": [
+                "# Histogram for big datasets",
+                "# Bins are counted here, so the chart stays small however many rows you have",
+                "fig = charts.histogram(df,",
+                "                       'column_name',",
+                "                       bins=30,",
+                "                       title='Distribution of Values')",
+                "fig"
+            ],
+            "description": "Distribution of a column with millions of rows"
+        },
+        "Box Plot (large data)": {
+            "code": [
+                "# Box plot for big datasets",
+                "# Quartiles are computed here; only the most extreme outliers are drawn",
+                "fig = charts.box(df,",
+                "                 y='column_name',",
+                "                 x='category_column',  # optional: one box per category",
+                "                 title='Box Plot')",
+                "fig"
+            ],
+            "description": "Spread and outliers of a large column"
+        },
+        "Bar Chart (large data)": {
+            "code": [
+                "# Bar chart for big datasets",
+                "# Values are aggregated per category here before plotting",
+                "fig = charts.bar(df,",
+                "                 x='category_column',",
+                "                 y='value_column',",
+                "                 agg='mean',  # or 'sum', 'median', 'count', ...",
+                "                 title='My Bar Chart')",
+                "fig"
+            ],
+            "description": "Compare categories across many rows"
         }
     },
     "💾 Save Results": {
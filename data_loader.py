@@ -0,0 +1,284 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import hashlib
+import threading
+import warnings
+import openpyxl
+from collections import OrderedDict
+from openpyxl.utils import column_index_from_string
+from pandas.tseries.api import guess_datetime_format
+from config import (
+    DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES, CSV_CHUNK_ROWS,
+    COMPACT_CATEGORY_MAX_RATIO
+)
+
+# A whole value that looks like a date with a four-digit year, optionally with a time;
+# '1.2.3' or '01-02-03' (versions, codes) don't
+DATE_LIKE_PATTERN = (
+    r'(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{4})'
+    r'(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?'
+)
+
+
+class DatasetCache:
+    """Process-wide LRU cache of parsed datasets, bounded by entry count and bytes"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(key)
+            return entry[0], entry[2]
+
+    def put(self, key, df, info=None):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            # Too big to ever fit, don't evict everything else for it
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, size, info)
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+
+dataset_cache = DatasetCache(DATASET_CACHE_MAX_ENTRIES, DATASET_CACHE_MAX_BYTES)
+
+
+def upload_digest(uploaded_file):
+    """Return the content hash of an upload, hashing each upload only once per session"""
+    digests = st.session_state.setdefault('upload_digests', {})
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is not None and file_id in digests:
+        return digests[file_id]
+
+    digest = hashlib.blake2b(uploaded_file.getbuffer(), digest_size=16).hexdigest()
+    if file_id is not None:
+        digests[file_id] = digest
+    return digest
+
+
+def dataset_key(uploaded_file, **options):
+    """Build the cache key for an upload: content hash plus reader options"""
+    reader = 'csv' if uploaded_file.name.endswith('.csv') else 'excel'
+    return (upload_digest(uploaded_file), reader, tuple(sorted(options.items())))
+
+
+def _pinned_dtypes(sample):
+    """Dtypes inferred from the first chunk, to reuse for every later chunk"""
+    # Leave object columns alone; pinning them gains nothing and dates/mixed
+    # values still need per-chunk inference
+    return {col: dtype for col, dtype in sample.dtypes.items() if dtype != object}
+
+
+def read_csv_chunked(uploaded_file, chunksize=CSV_CHUNK_ROWS, progress=None, **options):
+    """Parse a CSV upload in chunks, calling progress(fraction, rows) after each one.
+
+    Dtypes are inferred from the first chunk and pinned for the rest, so later
+    chunks parse straight into compact columns. If a later chunk doesn't fit
+    the pinned dtypes the file is re-read with per-chunk inference.
+    """
+    total_bytes = uploaded_file.getbuffer().nbytes or 1
+
+    def read_chunks(dtype):
+        uploaded_file.seek(0)
+        chunks = []
+        rows = 0
+        reader = pd.read_csv(uploaded_file, chunksize=chunksize, dtype=dtype, **options)
+        with reader:
+            for chunk in reader:
+                chunks.append(chunk)
+                rows += len(chunk)
+                if progress is not None:
+                    progress(min(uploaded_file.tell() / total_bytes, 1.0), rows)
+        return chunks
+
+    user_dtype = options.pop('dtype', None)
+    uploaded_file.seek(0)
+    sample = pd.read_csv(uploaded_file, nrows=chunksize, dtype=user_dtype, **options)
+    if user_dtype is None or isinstance(user_dtype, dict):
+        pinned = {**_pinned_dtypes(sample), **(user_dtype or {})} or None
+    else:
+        pinned = user_dtype
+    try:
+        chunks = read_chunks(pinned)
+    except (ValueError, TypeError, OverflowError):
+        chunks = read_chunks(user_dtype)
+
+    if not chunks:
+        return sample
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def is_xlsx(uploaded_file):
+    return uploaded_file.name.lower().endswith(('.xlsx', '.xlsm'))
+
+
+def list_excel_sheets(uploaded_file):
+    """List the sheet names of an .xlsx upload without parsing any sheet"""
+    uploaded_file.seek(0)
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def parse_column_range(columns):
+    """Turn 'B:F' (or a single 'C') into 1-based (min_col, max_col)"""
+    if not columns:
+        return None, None
+    start, sep, end = columns.replace(' ', '').upper().partition(':')
+    min_col = column_index_from_string(start) if start else None
+    if not sep:
+        return min_col, min_col
+    return min_col, column_index_from_string(end) if end else None
+
+
+def read_excel_range(uploaded_file, sheet=None, first_row=1, last_row=None, columns=None):
+    """Stream one sheet (or a block of it) out of an .xlsx upload.
+
+    Uses openpyxl's read-only mode, so only the selected rows and columns are
+    ever materialised. The first row of the block is used as the header.
+    """
+    min_col, max_col = parse_column_range(columns)
+    uploaded_file.seek(0)
+    workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = worksheet.iter_rows(
+            min_row=first_row or 1,
+            max_row=last_row or None,
+            min_col=min_col,
+            max_col=max_col,
+            values_only=True
+        )
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        records = list(rows)
+    finally:
+        workbook.close()
+
+    names = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+    return pd.DataFrame.from_records(records, columns=names).infer_objects()
+
+
+def read_dataset(uploaded_file, chunked=False, progress=None, **options):
+    """Parse an uploaded CSV or Excel file into a DataFrame"""
+    uploaded_file.seek(0)
+    if uploaded_file.name.endswith('.csv'):
+        if chunked:
+            return read_csv_chunked(uploaded_file, progress=progress, **options)
+        return pd.read_csv(uploaded_file, **options)
+    if is_xlsx(uploaded_file):
+        return read_excel_range(uploaded_file, **options)
+    return pd.read_excel(uploaded_file, **options)
+
+
+def _is_text(series):
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def _parse_dates(series):
+    """Return the column parsed as datetimes, or None if it isn't date-like.
+
+    Every value has to parse with one format inferred from the first, and
+    print back with it to the same text, so nothing is reinterpreted.
+    """
+    values = series.dropna().astype(str)
+    if values.empty:
+        return None
+    if not values.iloc[:100].str.fullmatch(DATE_LIKE_PATTERN).all():
+        return None
+    date_format = guess_datetime_format(values.iloc[0])
+    if date_format is None:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        parsed = pd.to_datetime(series, format=date_format, errors='coerce')
+    # Only accept the conversion if no values were lost to NaT
+    if parsed.isna().sum() != series.isna().sum():
+        return None
+    if not (parsed.dropna().dt.strftime(date_format) == values).all():
+        return None
+    return parsed
+
+
+def _downcast_float(series):
+    downcast = series.astype(np.float32)
+    same = (downcast.astype(series.dtype) == series) | series.isna()
+    return downcast if same.all() else series
+
+
+def compact_frame(df):
+    """Shrink a frame's memory without losing values.
+
+    Date-like text columns become datetimes, low-cardinality text columns
+    become categories and numeric columns are downcast where every value
+    survives the round trip. Returns the compacted frame and a report with
+    deep memory before/after and the dtype changes made.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    changes = {}
+    df = df.copy(deep=False)
+
+    for col in df.columns:
+        series = df[col]
+        new = series
+        if _is_text(series):
+            parsed = _parse_dates(series)
+            if parsed is not None:
+                new = parsed
+            elif len(series) and series.nunique(dropna=True) / len(series) <= COMPACT_CATEGORY_MAX_RATIO:
+                new = series.astype('category')
+        elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_extension_array_dtype(series):
+            new = pd.to_numeric(series, downcast='unsigned' if series.min() >= 0 else 'integer')
+        elif pd.api.types.is_float_dtype(series) and series.dtype == np.float64:
+            new = _downcast_float(series)
+
+        if new.dtype != series.dtype:
+            changes[col] = (str(series.dtype), str(new.dtype))
+            df[col] = new
+
+    report = {
+        'memory_before': before,
+        'memory_after': int(df.memory_usage(deep=True).sum()),
+        'changes': changes
+    }
+    return df, report
+
+
+def load_dataset(uploaded_file, key, chunked=False, progress=None, compact=False, **options):
+    """Return the parsed dataset for an upload, parsing only on a cache miss.
+
+    The cached frame is shared between sessions, so callers always get a copy
+    they are free to mutate in place. Returns the frame and the compaction
+    report (None when compact is off).
+    """
+    df, report = dataset_cache.get(key)
+    if df is None:
+        df = read_dataset(uploaded_file, chunked=chunked, progress=progress, **options)
+        if compact:
+            df, report = compact_frame(df)
+        dataset_cache.put(key, df, report)
+    return df.copy(), report
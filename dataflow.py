@@ -0,0 +1,259 @@
+import ast
+
+
+class _NameCollector(ast.NodeVisitor):
+    """Collect the global names a cell reads and the ones it (re)binds or mutates.
+
+    Reads are over-approximated (any loaded name, at any depth). Writes are
+    module-level bindings plus in-place mutations we can see syntactically:
+    `x[...] = ...`, `x.attr = ...`, `del x[...]`, augmented assignment and
+    `x.method(..., inplace=True)`.
+
+    Other method calls may change their receiver too, which depends on the
+    value, so they are collected separately in mutates: calls to a known
+    mutating method (`x.append(...)`, `df.insert(...)`) and calls whose
+    result is thrown away, which are made for their effect. The displayed
+    trailing expression isn't thrown away, so `df.describe()` doesn't count.
+    """
+
+    def __init__(self, displayed=None):
+        self.reads = set()
+        self.writes = set()
+        self.bindings = set()  # writes that rebind the name rather than mutate it
+        self.mutates = set()
+        self._depth = 0
+        self._globals = set()
+        self._displayed = displayed  # the cell's trailing expression statement, if this is it
+        self._discarded = set()  # calls whose result is thrown away
+
+    def _bind(self, name):
+        if self._depth == 0 or name in self._globals:
+            self.writes.add(name)
+            self.bindings.add(name)
+
+    def _mutate(self, node):
+        name = _base_name(node)
+        if name is not None:
+            self.reads.add(name)
+            self.writes.add(name)
+
+    def _nested(self, nodes):
+        self._depth += 1
+        for node in nodes:
+            self.visit(node)
+        self._depth -= 1
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.reads.add(node.id)
+        else:
+            self._bind(node.id)
+
+    def visit_Global(self, node):
+        self._globals.update(node.names)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._bind(alias.asname or alias.name.split('.')[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name != '*':
+                self._bind(alias.asname or alias.name)
+
+    def visit_FunctionDef(self, node):
+        self._bind(node.name)
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        self.visit(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        self._nested(node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._bind(node.name)
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self._nested(node.body)
+
+    def visit_Lambda(self, node):
+        self.visit(node.args)
+        self._nested([node.body])
+
+    def _visit_comprehension(self, node):
+        self._nested(ast.iter_child_nodes(node))
+
+    visit_ListComp = _visit_comprehension
+    visit_SetComp = _visit_comprehension
+    visit_DictComp = _visit_comprehension
+    visit_GeneratorExp = _visit_comprehension
+
+    def visit_ExceptHandler(self, node):
+        if node.name:
+            self._bind(node.name)
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if isinstance(node.target, ast.Name):
+            self.reads.add(node.target.id)
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            self._mutate(node.value)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if not isinstance(node.ctx, ast.Load):
+            self._mutate(node.value)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        inplace = any(
+            kw.arg == 'inplace' and isinstance(kw.value, ast.Constant) and kw.value.value is True
+            for kw in node.keywords
+        )
+        if isinstance(node.func, ast.Attribute):
+            if inplace:
+                self._mutate(node.func.value)
+            elif node.func.attr in _MUTATING_METHODS or node in self._discarded:
+                name = _base_name(node.func.value)
+                if name is not None:
+                    self.mutates.add(name)
+        self.generic_visit(node)
+
+    def visit_Expr(self, node):
+        if node is not self._displayed and isinstance(node.value, ast.Call):
+            self._discarded.add(node.value)
+        self.generic_visit(node)
+
+
+# Methods that change their receiver in place (builtin containers, pandas, NumPy)
+_MUTATING_METHODS = frozenset({
+    'append', 'extend', 'insert', 'remove', 'pop', 'popitem', 'clear', 'update', 'setdefault',
+    'sort', 'reverse', 'add', 'discard', 'difference_update', 'intersection_update',
+    'symmetric_difference_update', 'fill', 'resize', 'put', 'itemset'
+})
+
+
+def _base_name(node):
+    """The name at the root of `x.a[...].b`, or None"""
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+# Statements that always bind their targets when they complete
+_DEFINITE_BINDINGS = (
+    ast.Assign, ast.AnnAssign, ast.Import, ast.ImportFrom,
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef
+)
+
+
+def analyze_names(tree):
+    """Return (reads, writes, mutates) frozensets of global names for a parsed cell.
+
+    reads only holds names used before the cell itself binds them, so
+    `x = 1; print(x)` doesn't depend on another cell's x. mutates holds the
+    names a method call may change in place (see _NameCollector).
+    """
+    reads = set()
+    writes = set()
+    mutates = set()
+    bound = set()
+    for statement in tree.body:
+        collector = _NameCollector(displayed=tree.body[-1])
+        collector.visit(statement)
+        reads |= collector.reads - bound
+        writes |= collector.writes
+        mutates |= collector.mutates - bound
+        if isinstance(statement, _DEFINITE_BINDINGS):
+            bound |= collector.bindings
+    return frozenset(reads), frozenset(writes), frozenset(mutates)
+
+
+def effective_writes(compiled, mutable):
+    """The names a cell writes, counting method-call mutations of names in mutable"""
+    return compiled.writes | (compiled.mutates & mutable)
+
+
+def is_stale(cell, compiled, upstream):
+    """Whether a cell's code changed, or a name it reads was written upstream since it last ran.
+
+    upstream maps names to the newest run stamp of a write made above the
+    cell (or from outside the notebook). Cells below that write the same
+    name don't count, so `print(df.shape)` followed by `df['x'] = 1`
+    doesn't keep re-running the first cell.
+    """
+    if not cell.get('executed') or cell.get('run_digest') != compiled.digest:
+        return True
+    stamp = cell.get('run_stamp') or 0
+    return any(upstream.get(name, 0) > stamp for name in compiled.reads)
+
+
+def plan_run(cells, compiled_cells, external_writes, mutable=frozenset()):
+    """Pick the cells an incremental Run All has to execute, in notebook order.
+
+    A cell runs if it is stale, or if it reads a name written by a cell that
+    is scheduled to run before it. compiled_cells holds the CompiledCell for
+    each cell (None when the code doesn't parse, which always runs so the
+    error gets reported). external_writes maps names changed outside the
+    notebook to the stamp of that change. Method calls on names in mutable
+    (names bound to values that can change in place) count as writes, so
+    the readers below a re-run `lst.append(...)` run again too.
+    """
+    upstream = dict(external_writes)
+    plan = []
+    for cell, compiled in zip(cells, compiled_cells):
+        if compiled is None:
+            plan.append(cell)
+            continue
+        if is_stale(cell, compiled, upstream):
+            plan.append(cell)
+            # Scheduled cells write after everything that already ran
+            stamp = float('inf')
+        else:
+            stamp = cell.get('run_stamp') or 0
+        for name in effective_writes(compiled, mutable):
+            upstream[name] = max(upstream.get(name, 0), stamp)
+    return plan
+
+
+def parallel_stages(cells, compiled_cells, mutable=frozenset()):
+    """Group cells into stages whose members can run concurrently.
+
+    Each stage runs against a snapshot of the namespace taken when it starts
+    and its bindings are merged back in notebook order. A cell goes in a
+    later stage than any earlier cell whose writes it reads, and than any
+    earlier cell writing the same name. That is the conflict rule: two cells
+    that write one name never run together, so notebook order decides the
+    final value. A cell that writes a name an earlier cell reads may share
+    that cell's stage (the reader sees the snapshot) but never precede it.
+
+    Method calls that may change a name in mutable (see _NameCollector)
+    count as writes, so `lst.append(...)` and a later reader of lst don't
+    share a stage, while cells that only read df do. Mutations the analysis
+    can't see are caught after the stage runs (see cell_manager). Cells
+    that don't parse go in the first stage with no dependencies.
+    """
+    levels = []
+    for i, compiled in enumerate(compiled_cells):
+        level = 0
+        if compiled is not None:
+            writes = effective_writes(compiled, mutable)
+            for j in range(i):
+                earlier = compiled_cells[j]
+                if earlier is None:
+                    continue
+                if effective_writes(earlier, mutable) & (compiled.reads | writes):
+                    level = max(level, levels[j] + 1)
+                elif earlier.reads & writes:
+                    level = max(level, levels[j])
+        levels.append(level)
+
+    stages = [[] for _ in range(max(levels) + 1)] if levels else []
+    for cell, compiled, level in zip(cells, compiled_cells, levels):
+        stages[level].append((cell, compiled))
+    return stages
@@ -0,0 +1,173 @@
+"""Display registry: how values produced by a cell are shown.
+
+Each display type maps Python types to a renderer. The kernel classifies
+a cell's trailing expression value, plus any newly bound names whose type
+asks for it (figures), into Display records. The page then draws each
+record with its type's renderer. Register extra types with
+register_display().
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from collections import namedtuple
+from plotly.basedatatypes import BaseFigure
+from config import DISPLAY_REPR_CHARS
+from figures import prepare_figure, figure_spec, render_figure
+from preview import render_frame_preview
+
+# One output of a cell; label is the variable name for captured bindings
+Display = namedtuple('Display', ['kind', 'value', 'label', 'note'])
+
+# prepare(value) -> (value, note) runs in the kernel when the cell runs, so
+# expensive conversions happen once; render(display, key, version) draws it.
+# capture_bound: also show values of this type bound by the cell, not just
+# its trailing expression
+DisplayType = namedtuple('DisplayType', ['kind', 'title', 'render', 'prepare', 'capture_bound'])
+
+_types = {}  # type or 'module.QualName' -> DisplayType
+_kinds = {}  # kind -> DisplayType
+_lookup_cache = {}  # type -> DisplayType or None
+
+
+def register_display(types, kind, render, prepare=None, capture_bound=False, title=None):
+    """Show values of the given types (and their subclasses) with render.
+
+    types may be a class, a 'module.QualName' string (matched without
+    importing the module) or a tuple of them. Registering a type again
+    replaces its renderer, so cheaper renderers can override the defaults.
+    """
+    display_type = _kinds[kind] = DisplayType(kind, title or kind, render, prepare, capture_bound)
+    for type_ in (types if isinstance(types, (tuple, list)) else (types,)):
+        _types[type_] = display_type
+    _lookup_cache.clear()
+    return display_type
+
+
+def display_type_of(value):
+    """The DisplayType registered for a value's class (nearest in the MRO), else None.
+
+    Objects with _repr_html_ fall back to the 'html' type.
+    """
+    klass = type(value)
+    try:
+        return _lookup_cache[klass]
+    except KeyError:
+        pass
+    found = None
+    for base in klass.__mro__:
+        found = _types.get(base) or _types.get(f"{base.__module__}.{base.__qualname__}")
+        if found is not None:
+            break
+    if found is None and hasattr(klass, '_repr_html_'):
+        found = _kinds['html']
+    _lookup_cache[klass] = found
+    return found
+
+
+def make_display(value, label=None):
+    """Classify a value and run its type's prepare step; unknown types show as repr()"""
+    display_type = display_type_of(value) or _kinds['value']
+    note = None
+    if display_type.prepare is not None:
+        try:
+            value, note = display_type.prepare(value)
+        except Exception as e:
+            return repr_display(value, label, f"Could not display as {display_type.title}: {e}")
+    return Display(display_type.kind, value, label, note)
+
+
+def repr_display(value, label=None, note=None):
+    """A plain repr() display, e.g. for a value that can't leave the worker process"""
+    return Display('value', _short(repr(value)), label, note)
+
+
+def collect_displays(namespace, result):
+    """Displays for a finished run: captured bindings in binding order, then the result"""
+    displays = []
+    for name in namespace.changed:
+        value = namespace.get(name)
+        if value is result:
+            continue
+        display_type = display_type_of(value)
+        if display_type is not None and display_type.capture_bound:
+            displays.append(make_display(value, name))
+    if result is not None:
+        displays.append(make_display(result))
+    return displays
+
+
+def render_display(display, key, version):
+    """Draw a display; key is (cell id, position in the cell's displays), version the execution count"""
+    display_type = _kinds.get(display.kind)
+    if display_type is None:
+        # Registered only in another process (the worker, or the one a
+        # checkpoint was saved from); show it as a plain value
+        if not isinstance(display.value, str):
+            display = display._replace(value=_short(repr(display.value)))
+        display_type = _kinds['value']
+    display_type.render(display, key, version)
+
+
+def display_title(display):
+    return _kinds[display.kind].title if display.kind in _kinds else display.kind
+
+
+def _render_frame(display, key, version):
+    render_frame_preview(display.value, "preview_{}_{}".format(*key), version)
+
+
+def _prepare_array(value):
+    note = f"ndarray {value.shape} {value.dtype}"
+    if 1 <= value.ndim <= 2:
+        return pd.DataFrame(value), note
+    return np.array2string(value, threshold=1000), note
+
+
+def _render_array(display, key, version):
+    st.caption(display.note)
+    if isinstance(display.value, pd.DataFrame):
+        _render_frame(display, key, version)
+    else:
+        st.text(display.value)
+
+
+def _prepare_figure(value):
+    fig, note = prepare_figure(value)
+    return figure_spec(fig), note
+
+
+def _render_figure(display, key, version):
+    try:
+        render_figure(display.value, "figure_{}_{}".format(*key))
+    except Exception as plot_error:
+        st.warning(f"⚠️ Could not display chart: {plot_error}")
+        return
+    if display.note:
+        st.caption(f"📉 {display.note}")
+
+
+def _short(text):
+    if len(text) > DISPLAY_REPR_CHARS:
+        return text[:DISPLAY_REPR_CHARS] + f"\n... ({len(text) - DISPLAY_REPR_CHARS:,} more characters)"
+    return text
+
+
+def _prepare_html(value):
+    # Rendered to a string in the kernel, so the object needn't be kept or pickled
+    return value._repr_html_() or '', None
+
+
+def _render_value(display, key, version):
+    if display.note:
+        st.caption(display.note)
+    st.code(display.value, language=None)
+
+
+# Fallbacks: anything else is shown as its repr(), objects with _repr_html_ as HTML
+register_display((), 'value', _render_value, prepare=lambda value: (_short(repr(value)), None), title="🔢 Value")
+register_display((), 'html', lambda display, key, version: st.html(display.value),
+                 prepare=_prepare_html, title="🌐 HTML")
+register_display(pd.DataFrame, 'dataframe', _render_frame, title="📊 DataFrame")
+register_display(pd.Series, 'series', _render_frame, title="📊 Series")
+register_display(np.ndarray, 'array', _render_array, prepare=_prepare_array, title="🔢 Array")
+register_display(BaseFigure, 'figure', _render_figure, prepare=_prepare_figure, capture_bound=True, title="📈 Chart")
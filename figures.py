@@ -0,0 +1,216 @@
+import numpy as np
+import plotly.io
+import streamlit as st
+import plotly.graph_objects as go
+from collections import namedtuple
+from config import FIGURE_MAX_POINTS, FIGURE_WEBGL_POINTS
+try:
+    # Streamlit internals for drawing a figure from its JSON (see _enqueue_spec);
+    # without them figures go through st.plotly_chart
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as _PlotlyChartProto
+    from streamlit.elements.lib.layout_utils import LayoutConfig as _LayoutConfig
+    from streamlit.elements.lib.utils import compute_and_register_element_id as _compute_element_id
+except ImportError:
+    _PlotlyChartProto = None
+
+# A figure serialized once, when its cell runs; only the JSON is kept, not the figure
+FigureSpec = namedtuple('FigureSpec', ['json', 'height'])
+
+# Per-point trace arrays that have to be subset along with x/y
+_POINT_ARRAYS = ('x', 'y', 'text', 'hovertext', 'customdata', 'ids')
+_MARKER_ARRAYS = ('color', 'size', 'symbol', 'opacity')
+_GRID_BINS = 64
+
+
+def _as_numbers(values, length):
+    """Float view of an x/y array for the samplers, or None if it isn't numeric or dates"""
+    if values is None:
+        return np.arange(length, dtype=float)
+    array = np.asarray(values)
+    if array.dtype.kind in 'OU':
+        # plotly keeps dates as ISO strings
+        try:
+            array = array.astype('datetime64[ns]')
+        except (ValueError, TypeError):
+            return None
+    if np.issubdtype(array.dtype, np.datetime64):
+        return array.astype('datetime64[ns]').astype(np.int64).astype(float)
+    if np.issubdtype(array.dtype, np.number) or array.dtype == bool:
+        return array.astype(float)
+    return None
+
+
+def lttb(x, y, threshold):
+    """Indices picked by Largest-Triangle-Three-Buckets, keeping the shape of a line.
+
+    The first and last points are always kept; each bucket in between
+    contributes the point forming the largest triangle with the previous
+    pick and the average of the next bucket.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        cx = np.nanmean(x[stop:next_stop]) if next_stop > stop else x[-1]
+        cy = np.nanmean(y[stop:next_stop]) if next_stop > stop else y[-1]
+        bx, by = x[start:stop], y[start:stop]
+        areas = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(areas, nan=-1.0)))
+        picked[i + 1] = a
+    return picked
+
+
+def stratified_sample(x, y, threshold, seed=0):
+    """Indices of a sample spread over a grid of the x/y plane.
+
+    Every occupied grid cell keeps at least one point, so sparse regions
+    and outliers survive while dense regions are thinned.
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    cells = np.zeros(n, dtype=np.int64)
+    for values in (x, y):
+        finite = np.isfinite(values)
+        low, high = (values[finite].min(), values[finite].max()) if finite.any() else (0.0, 0.0)
+        span = (high - low) or 1.0
+        bins = np.clip(((np.nan_to_num(values, nan=low) - low) / span * _GRID_BINS).astype(np.int64), 0, _GRID_BINS - 1)
+        cells = cells * _GRID_BINS + bins
+
+    # Rank the points of each cell in random order and keep the first quota
+    order = np.random.default_rng(seed).permutation(n)
+    order = order[np.argsort(cells[order], kind='stable')]
+    sorted_cells = cells[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    ranks = np.arange(n) - np.repeat(group_starts, np.diff(np.r_[group_starts, n]))
+    quota = max(1, threshold // len(group_starts))
+    return np.sort(order[ranks < quota])
+
+
+def _subset(props, indices, length):
+    for name in _POINT_ARRAYS:
+        value = props.get(name)
+        if value is not None and not isinstance(value, str) and len(value) == length:
+            props[name] = np.asarray(value)[indices]
+    marker = props.get('marker') or {}
+    for name in _MARKER_ARRAYS:
+        value = marker.get(name)
+        if value is not None and not isinstance(value, str) and np.ndim(value) == 1 and len(value) == length:
+            marker[name] = np.asarray(value)[indices]
+
+
+def _trace_length(trace):
+    for name in ('y', 'x'):
+        value = getattr(trace, name, None)
+        if value is not None:
+            return len(value)
+    return 0
+
+
+def prepare_figure(fig):
+    """Make a figure cheap to draw: downsample oversized line/scatter traces and switch them to WebGL.
+
+    Returns (figure, note). The user's figure is left alone; when a trace
+    needs changing a reduced copy is returned along with a note such as
+    "Showing 20,000 of 2,000,000 points". Animated figures and stacked
+    traces are returned unchanged.
+    """
+    if not isinstance(fig, go.Figure) or fig.frames:
+        return fig, None
+    if not any(
+        trace.type in ('scatter', 'scattergl') and _trace_length(trace) > FIGURE_WEBGL_POINTS
+        for trace in fig.data
+    ):
+        return fig, None
+
+    traces = []
+    shown = total = 0
+    for trace in fig.data:
+        length = _trace_length(trace)
+        if trace.type not in ('scatter', 'scattergl') or length <= FIGURE_WEBGL_POINTS or getattr(trace, 'stackgroup', None):
+            traces.append(trace)
+            continue
+        props = trace.to_plotly_json()
+        props.pop('type', None)
+        total += length
+        if length > FIGURE_MAX_POINTS:
+            x = _as_numbers(props.get('x'), length)
+            y = _as_numbers(props.get('y'), length)
+            if x is None or y is None:
+                indices = np.linspace(0, length - 1, FIGURE_MAX_POINTS).astype(np.int64)
+            elif 'lines' in (props.get('mode') or 'lines'):
+                indices = lttb(x, y, FIGURE_MAX_POINTS)
+            else:
+                indices = stratified_sample(x, y, FIGURE_MAX_POINTS)
+            _subset(props, indices, length)
+            shown += len(indices)
+        else:
+            shown += length
+        # Properties WebGL traces don't support (e.g. spline smoothing) are dropped
+        traces.append(go.Scattergl(props, skip_invalid=True))
+
+    note = "Drawn with WebGL"
+    if shown < total:
+        note = f"Showing {shown:,} of {total:,} points (downsampled), drawn with WebGL"
+    return go.Figure(data=traces, layout=fig.layout), note
+
+
+def _chart_size(fig):
+    # Same defaults st.plotly_chart uses for height='content'
+    height = fig.layout.height if isinstance(fig, go.Figure) else None
+    return int(height) if isinstance(height, (int, float)) and height > 0 else 450
+
+
+def _enqueue_spec(spec, height, key):
+    """Add a plotly chart element from already-serialized JSON.
+
+    This is what st.plotly_chart does after validating and serializing the
+    figure. Returns False, having added nothing, if Streamlit's internals
+    aren't what this expects.
+    """
+    if _PlotlyChartProto is None:
+        return False
+    try:
+        proto = _PlotlyChartProto()
+        proto.theme = 'streamlit'
+        proto.spec = spec
+        proto.config = '{}'
+        layout_config = _LayoutConfig(width='stretch', height=height)
+        enqueue = st._main._enqueue
+        # Registers the key, so nothing that can fail comes after it
+        proto.id = _compute_element_id(
+            'plotly_chart',
+            user_key=key,
+            key_as_main_identity=False,
+            dg=st._main,
+            plotly_spec=spec,
+            plotly_config=proto.config,
+            theme='streamlit',
+            width='stretch',
+            height=height
+        )
+    except Exception:
+        return False
+    enqueue('plotly_chart', proto, layout_config=layout_config)
+    return True
+
+
+def figure_spec(fig):
+    """Serialize a figure for drawing, once; reruns of the page redraw it from the JSON"""
+    return FigureSpec(plotly.io.to_json(fig, validate=False), _chart_size(fig))
+
+
+def render_figure(spec, key):
+    """Draw a FigureSpec without validating or serializing the figure again.
+
+    key tells apart identical figures, e.g. 'figure_<cell id>_<position>'.
+    """
+    if not _enqueue_spec(spec.json, spec.height, key):
+        # Streamlit's internals changed; the public API still works
+        st.plotly_chart(plotly.io.from_json(spec.json, skip_invalid=True), use_container_width=True, key=key)
@@ -0,0 +1,235 @@
+"""Hibernate idle sessions: move their variables and cell results to disk until they're used again.
+
+Every script run, cell fragment run and widget callback goes through
+session_activity(), which records when the session was last used and
+wakes it if it was hibernated. Callbacks run before the app script, so
+they are wrapped with track_activity() themselves. A background thread checks every
+HIBERNATE_CHECK_SECONDS for inline-kernel sessions idle longer than
+HIBERNATE_IDLE_MINUTES, writes their state with checkpoint.write_state
+and drops it from memory. Waking maps it back in, so it takes about as
+long as a checkpoint restore. Sessions Streamlit has closed are dropped,
+along with their files, on the next check.
+
+Cell dicts are updated in place rather than replaced, because a cell
+fragment rerun holds on to its cell.
+"""
+import os
+import time
+import shutil
+import threading
+import functools
+from contextlib import contextmanager
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    # Without a script context sessions are never tracked, so never hibernated
+    def get_script_run_ctx():
+        return None
+from checkpoint import write_state, read_state, unpicklable_names
+from config import HIBERNATE_DIR, HIBERNATE_IDLE_MINUTES, HIBERNATE_CHECK_SECONDS
+from namespace import new_namespace
+
+# Per-cell fields moved to disk; the long-output spill file handle stays
+_CELL_FIELDS = ('output', 'displays')
+# Caches rebuilt on demand, dropped rather than saved
+_CACHES = ('preview_orders', 'size_cache')
+
+_sessions = {}  # session id -> activity record, see _record()
+_sessions_lock = threading.Lock()
+_watcher = None
+
+
+def _path(session_id):
+    return os.path.join(HIBERNATE_DIR, session_id)
+
+
+def _session_state(ctx):
+    # ctx.session_state is a wrapper made for each script run; the
+    # SessionState inside it lasts as long as the session
+    return getattr(ctx.session_state, '_state', ctx.session_state)
+
+
+def _session_closed(session_id):
+    """Whether Streamlit has let go of the session; when that can't be told (no runtime, e.g. in tests) it hasn't"""
+    try:
+        from streamlit.runtime import Runtime
+        if not Runtime.exists():
+            return False
+        # Disconnected sessions are kept for a while and can come back
+        return Runtime.instance()._session_mgr.get_session_info(session_id) is None
+    except Exception:
+        return False
+
+
+def _record(ctx):
+    state = _session_state(ctx)
+    with _sessions_lock:
+        record = _sessions.get(ctx.session_id)
+        if record is None or record['state'] is not state:
+            record = _sessions[ctx.session_id] = {
+                # Held until the watcher sees the session closed
+                'state': state,
+                'lock': threading.Lock(),
+                'running': 0,
+                'last_active': time.time()
+            }
+        _start_watcher()
+        return record
+
+
+@contextmanager
+def session_activity():
+    """Mark the session as in use for the duration of the block, waking it first if needed"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        yield
+        return
+    record = _record(ctx)
+    with record['lock']:
+        record['running'] += 1
+        try:
+            if 'hibernation' in ctx.session_state and ctx.session_state['hibernation']['asleep']:
+                _wake(ctx.session_state, _path(ctx.session_id))
+        except BaseException:
+            record['running'] -= 1
+            raise
+    try:
+        yield
+    finally:
+        with record['lock']:
+            record['running'] -= 1
+            record['last_active'] = time.time()
+
+
+def track_activity(func):
+    """Decorator form of session_activity(), for fragments and widget callbacks, which run outside the app script's block"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with session_activity():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _hibernate(session, path):
+    """Write the session's variables and results to path and drop them from memory"""
+    variables = dict(session['variables'].user_items())
+    state = {
+        'variables': variables,
+        'df': session['df'],
+        'cells': {cell['id']: {field: cell[field] for field in _CELL_FIELDS} for cell in session['cells']},
+        'snapshots': session['snapshots']
+    }
+    try:
+        write_state(path, state)
+    except Exception:
+        # Keep what can't be pickled in memory, and release the rest
+        kept = unpicklable_names(variables)
+        for name in kept:
+            del variables[name]
+        # Snapshots may hold the same values; they aren't worth keeping
+        # the session awake for
+        session['snapshots'].clear()
+        del state['snapshots']
+        write_state(path, state)
+
+    namespace = new_namespace()
+    for name, value in session['variables'].user_items():
+        if name not in variables:
+            namespace.inject(name, value)
+    session['variables'] = namespace
+    session['df'] = None
+    for cell in session['cells']:
+        for field in _CELL_FIELDS:
+            cell[field] = None
+    session['result_memo'].clear()
+    session['result_store'].clear()
+    if 'snapshots' in state:
+        session['snapshots'].clear()
+    for key in _CACHES:
+        if key in session:
+            session[key] = {}
+    session['hibernation'] = dict(session['hibernation'], asleep=True, hibernated_at=time.time())
+
+
+def _wake(session, path):
+    started = time.monotonic()
+    try:
+        state = read_state(path)
+    except Exception:
+        # The files are gone (e.g. the temp directory was cleaned); the
+        # cells have to run again
+        state = {'variables': {}, 'df': None, 'cells': {}}
+        for cell in session['cells']:
+            cell['executed'] = False
+            cell['run_digest'] = None
+    # Array data stays mapped after the files are gone
+    shutil.rmtree(path, ignore_errors=True)
+
+    namespace = session['variables']
+    for name, value in state['variables'].items():
+        namespace.inject(name, value)
+    session['df'] = state['df']
+    for cell in session['cells']:
+        saved = state['cells'].get(cell['id'])
+        if saved is not None:
+            cell.update(saved)
+            if cell['executed']:
+                session['result_store'].put(cell['id'], cell['displays'])
+    if 'snapshots' in state:
+        session['snapshots'] = state['snapshots']
+    session['hibernation'] = dict(
+        session['hibernation'],
+        asleep=False,
+        woke_at=time.time(),
+        wake_seconds=time.monotonic() - started,
+        count=session['hibernation']['count'] + 1
+    )
+
+
+def _idle(record, session):
+    return (
+        not record['running']
+        and time.time() - record['last_active'] >= HIBERNATE_IDLE_MINUTES * 60
+        and 'hibernation' in session
+        and not session['hibernation']['asleep']
+        # The worker kernel's namespace lives in its own process
+        and session['kernel_mode'] != 'worker'
+    )
+
+
+def hibernate_idle_sessions():
+    """Hibernate every session that has been idle long enough; returns how many were"""
+    hibernated = 0
+    with _sessions_lock:
+        records = list(_sessions.items())
+    for session_id, record in records:
+        session = record['state']
+        if _session_closed(session_id):
+            with _sessions_lock:
+                _sessions.pop(session_id, None)
+            # Files of a session that ended while hibernated
+            shutil.rmtree(_path(session_id), ignore_errors=True)
+            continue
+        with record['lock']:
+            try:
+                if not _idle(record, session):
+                    continue
+                _hibernate(session, _path(session_id))
+                hibernated += 1
+            except Exception:
+                # Try again after another idle period rather than every check
+                record['last_active'] = time.time()
+    return hibernated
+
+
+def _watch():
+    while True:
+        time.sleep(HIBERNATE_CHECK_SECONDS)
+        hibernate_idle_sessions()
+
+
+def _start_watcher():
+    global _watcher
+    if _watcher is None:
+        _watcher = threading.Thread(target=_watch, name='notebook-hibernation', daemon=True)
+        _watcher.start()
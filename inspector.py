@@ -0,0 +1,138 @@
+"""Memory footprint of a session's variables and cell results, for the sidebar inspector.
+
+Deep sizes of large frames are slow to compute, so each is cached in
+session state by object identity plus a version: for a variable, the
+newest run stamp of a cell that (re)binds or mutates it; for a cell
+result, its execution count. Reruns of the page reuse the cached sizes.
+"""
+import sys
+import types
+import numpy as np
+import pandas as pd
+import streamlit as st
+from itertools import islice
+from plotly.basedatatypes import BaseFigure
+from cell_manager import write_stamps
+from figures import FigureSpec
+from memo import estimate_size
+from results import SpilledValue, value_size
+
+# Containers and objects are walked this deep, and this many items per level
+_MAX_DEPTH = 4
+_MAX_ITEMS = 10_000
+# Sized as they are, without following what they refer to
+_OPAQUE_TYPES = (
+    BaseFigure, FigureSpec, type, types.ModuleType, types.FunctionType,
+    types.BuiltinFunctionType, types.MethodType
+)
+
+
+def _slot_names(klass):
+    for base in klass.__mro__:
+        slots = base.__dict__.get('__slots__', ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if name in ('__dict__', '__weakref__'):
+                continue
+            if name.startswith('__') and not name.endswith('__'):
+                name = f"_{base.__name__.lstrip('_')}{name}"
+            yield name
+
+
+def _parts(value):
+    """What a value refers to: container items, or an object's __dict__ and __slots__ attributes"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield key
+            yield item
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        yield from value
+    else:
+        attributes = getattr(value, '__dict__', None)
+        if isinstance(attributes, dict):
+            yield attributes
+        for name in _slot_names(type(value)):
+            try:
+                yield getattr(value, name)
+            except AttributeError:
+                continue
+
+
+def deep_size(value, _seen=None, _depth=0):
+    """Approximate bytes reachable from a value, counting shared objects once"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray, str, bytes)):
+        return estimate_size(value)
+    if isinstance(value, _OPAQUE_TYPES):
+        return value_size(value)
+    size = sys.getsizeof(value)
+    if _depth < _MAX_DEPTH:
+        for part in islice(_parts(value), _MAX_ITEMS):
+            size += deep_size(part, _seen, _depth + 1)
+    return size
+
+
+def describe(value):
+    """(type name, shape) labels for a value"""
+    if isinstance(value, FigureSpec):
+        return "Figure", ""
+    type_name = type(value).__name__
+    shape = getattr(value, 'shape', None)
+    if isinstance(shape, tuple):
+        return type_name, " × ".join(f"{n:,}" for n in shape) or "scalar"
+    if isinstance(value, (list, tuple, set, frozenset, dict, str, bytes)):
+        return type_name, f"{len(value):,} items" if not isinstance(value, (str, bytes)) else f"{len(value):,} chars"
+    return type_name, ""
+
+
+def _cached_size(cache, sizes, key, version, compute):
+    entry = cache.get(key)
+    if entry is None or entry[0] != version:
+        entry = (version, compute())
+    sizes[key] = entry
+    return entry[1]
+
+
+def memory_report(include_variables=True):
+    """Rows for the inspector, largest first.
+
+    Each row is a dict with kind ('variable' or 'cell'), target (name or
+    cell id), label, type, shape, size (bytes in memory) and on_disk
+    (bytes of results spilled to temp files).
+    """
+    cache = st.session_state.setdefault('size_cache', {})
+    sizes = {}
+    rows = []
+
+    if include_variables:
+        stamps = write_stamps()
+        for name, value in st.session_state.variables.user_items():
+            type_name, shape = describe(value)
+            size = _cached_size(cache, sizes, ('variable', name, id(value)), stamps.get(name), lambda: deep_size(value))
+            rows.append({'kind': 'variable', 'target': name, 'label': name, 'type': type_name,
+                         'shape': shape, 'size': size, 'on_disk': 0})
+
+    for idx, cell in enumerate(st.session_state.cells):
+        displays = cell.get('displays')
+        if not displays:
+            continue
+        in_memory = [display.value for display in displays if not isinstance(display.value, SpilledValue)]
+        size = _cached_size(
+            cache, sizes, ('cell', cell['id'], id(displays)),
+            (cell['execution_count'], len(in_memory)),
+            lambda: sum(deep_size(value) for value in in_memory)
+        )
+        type_name, shape = describe(in_memory[-1]) if in_memory else ("on disk", "")
+        rows.append({'kind': 'cell', 'target': cell['id'], 'label': f"Cell {idx + 1} result",
+                     'type': type_name, 'shape': shape, 'size': size,
+                     'on_disk': sum(display.value.size for display in displays if isinstance(display.value, SpilledValue))})
+
+    # Only what's listed now is kept, so entries for deleted objects don't pile up
+    st.session_state.size_cache = sizes
+    rows.sort(key=lambda row: row['size'], reverse=True)
+    return rows
@@ -0,0 +1,42 @@
+from memo import RESULT_FIELDS
+from capture import OutputBuffer, capture_output
+from display import collect_displays
+
+
+def run_code(namespace, compiled, output_buffer=None):
+    """Execute a compiled cell in a namespace and return its display fields.
+
+    Shared by the in-process kernel and the worker process. print(),
+    stdout/stderr writes and logging from this thread are captured into
+    output_buffer; other sessions running at the same time keep their own.
+    Exceptions from the cell propagate to the caller.
+    """
+    fields = dict.fromkeys(RESULT_FIELDS)
+    output_buffer = output_buffer if output_buffer is not None else OutputBuffer()
+    error_buffer = OutputBuffer(spill=False)
+
+    namespace.begin_run()
+
+    result = None
+    try:
+        with capture_output(output_buffer, error_buffer):
+            # Statements run once via exec; only a trailing expression
+            # is eval'd for display, so nothing executes twice
+            if compiled.body is not None:
+                exec(compiled.body, namespace)
+            if compiled.expr is not None:
+                result = eval(compiled.expr, namespace)
+
+        # The result plus figures bound by this run; older names are left alone
+        fields['displays'] = collect_displays(namespace, result)
+
+        captured_output = output_buffer.getvalue()
+        captured_errors = error_buffer.getvalue()
+        full_output = captured_output + captured_errors if captured_errors else captured_output
+        fields['output'] = full_output if full_output else None
+        # Full stdout when the in-memory copy had to be cut down
+        fields['output_spill'] = output_buffer.spill()
+    finally:
+        # An error or interrupt leaves no output to page through; drop the file
+        output_buffer.discard()
+    return fields
@@ -0,0 +1,330 @@
+import os
+import sys
+import time
+import pickle
+import signal
+import weakref
+import itertools
+import traceback
+import subprocess
+import multiprocessing
+import streamlit as st
+from multiprocessing.connection import Connection
+from capture import OutputBuffer, StreamingBuffer
+from config import WORKER_POLL_INTERVAL, WORKER_STREAM_INTERVAL, RUNNING_PREVIEW_CHARS
+
+
+def _picklable(displays):
+    """Displays that can be sent to the parent; unpicklable values are shown as repr()"""
+    from display import repr_display
+    sendable = []
+    for display in displays:
+        try:
+            pickle.dumps(display.value)
+            sendable.append(display)
+        except Exception:
+            sendable.append(repr_display(display.value, display.label))
+    return sendable
+
+
+def _hand_over(fields):
+    # The parent takes ownership of the spilled output file
+    if fields['output_spill'] is not None:
+        fields['output_spill'].detach()
+
+
+def _send(conn, message):
+    """conn.send with SIGINT held back, so an interrupt can't cut a message short on the pipe.
+
+    A SIGINT that arrives meanwhile is delivered (as KeyboardInterrupt)
+    once the message is out.
+    """
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT})
+    try:
+        conn.send(message)
+    finally:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGINT})
+
+
+def _send_done(conn, run_id, response):
+    try:
+        _send(conn, ('done', run_id, response))
+    except KeyboardInterrupt:
+        # The run is over and its response was sent; nothing left to stop
+        pass
+
+
+def _worker_main(conn):
+    """Kernel process loop: keeps one namespace alive and runs cells sent to it"""
+    from compiler import compile_cell
+    from kernel import run_code
+    from namespace import new_namespace
+
+    # SIGINT from the Interrupt button becomes KeyboardInterrupt inside the cell
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    namespace = new_namespace()
+    # The parent only interrupts once told the imports are done, so an
+    # interrupt can't kill the process. One sent before the first cell
+    # arrives is meant for that cell, so SIGINT stays blocked (pending)
+    # until the cell starts
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT})
+    conn.send(('ready', None, None))
+
+    while True:
+        try:
+            message = conn.recv()
+        except KeyboardInterrupt:
+            # Interrupted while idle; nothing to stop
+            continue
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        kind, run_id, payload = message
+        if kind == 'isolated':
+            _send_done(conn, run_id, _run_isolated(*payload))
+            continue
+
+        cell_id, code_str, send_df, df = payload
+        if send_df:
+            namespace.inject('df', df)
+
+        response = {'cell_id': cell_id, 'code': code_str, 'fields': None, 'error': None, 'error_traceback': None}
+        output_buffer = StreamingBuffer(lambda text: _send(conn, ('stdout', run_id, text)), WORKER_STREAM_INTERVAL)
+        try:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGINT})
+            compiled = compile_cell(code_str)
+            fields = run_code(namespace, compiled, output_buffer)
+            fields['displays'] = _picklable(fields['displays'])
+            _hand_over(fields)
+            response['fields'] = fields
+            # Send the dataset back if the cell rebound or visibly mutated it
+            if 'df' in namespace.changed or 'df' in compiled.writes:
+                response['df'] = namespace['df']
+        except (Exception, KeyboardInterrupt) as e:
+            response['error'] = str(e) or type(e).__name__
+            response['error_traceback'] = traceback.format_exc()
+        try:
+            output_buffer.send_pending()
+        except KeyboardInterrupt:
+            # Came in while the last output was sent; the run is already over
+            pass
+        _send_done(conn, run_id, response)
+
+
+def _run_isolated(cell_id, code_str, inputs):
+    """Run a cell in a throwaway namespace built from pickled inputs (parallel Run All).
+
+    Returns the display fields plus the pickled names the cell bound or
+    mutated, including inputs changed by method calls (`lst.append(...)`),
+    which are found by comparing fingerprints. 'rerun' is set when a binding
+    can't be pickled, so the parent has to run the cell itself.
+    """
+    from compiler import compile_cell
+    from kernel import run_code
+    from memo import fingerprint
+    from namespace import new_namespace
+
+    response = {'cell_id': cell_id, 'code': code_str, 'fields': None, 'bindings': {},
+                'rerun': False, 'error': None, 'error_traceback': None}
+    namespace = new_namespace()
+    try:
+        for name, data in inputs.items():
+            namespace.inject(name, pickle.loads(data))
+        before = {name: fingerprint(namespace[name]) for name in inputs}
+        compiled = compile_cell(code_str)
+        fields = run_code(namespace, compiled)
+        fields['displays'] = _picklable(fields['displays'])
+        _hand_over(fields)
+        response['fields'] = fields
+        changed = set(namespace.changed) | (compiled.writes & set(namespace))
+        for name, digest in before.items():
+            # Values fingerprinted by identity can't be checked, so they go back too
+            if name in namespace and (digest[0] == 'id' or fingerprint(namespace[name]) != digest):
+                changed.add(name)
+        for name in changed:
+            try:
+                response['bindings'][name] = pickle.dumps(namespace[name], protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                response['rerun'] = True
+    except (Exception, KeyboardInterrupt) as e:
+        response['error'] = str(e) or type(e).__name__
+        response['error_traceback'] = traceback.format_exc()
+    return response
+
+
+def _stop_process(process, conn):
+    if process.poll() is None:
+        try:
+            conn.send(None)
+            process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+    conn.close()
+
+
+class KernelWorker:
+    """Handle on a session's kernel process.
+
+    The session's namespace lives in a child Python process connected by a
+    pipe. Cells are submitted one at a time; poll() collects streamed stdout
+    and the final response.
+    """
+
+    def __init__(self):
+        # A plain subprocess rather than multiprocessing's spawn, which would
+        # re-import __main__ (the Streamlit app script) in the child
+        self.conn, child_conn = multiprocessing.Pipe()
+        here = os.path.dirname(os.path.abspath(__file__))
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(here, 'kernel_worker.py'), str(child_conn.fileno())],
+            pass_fds=[child_conn.fileno()],
+            cwd=here
+        )
+        child_conn.close()
+        self.pending = None
+        # Until the process says it's ready, SIGINT would kill it mid-import
+        self._ready = False
+        self._interrupt_requested = False
+        self._run_ids = itertools.count()
+        self._df_sent = None
+        self._df_synced = False
+        # Stop the process when the session (and this handle) goes away
+        self._finalizer = weakref.finalize(self, _stop_process, self.process, self.conn)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def _start(self, kind, cell_id, code_str, payload):
+        if self.pending is not None:
+            raise RuntimeError("The kernel is still running another cell")
+        run_id = next(self._run_ids)
+        self.pending = {
+            'run_id': run_id,
+            'cell_id': cell_id,
+            'code': code_str,
+            'started': time.monotonic(),
+            'output': OutputBuffer(spill=False)
+        }
+        self.conn.send((kind, run_id, payload))
+
+    def submit(self, cell_id, code_str, df):
+        """Run a cell in the worker's persistent namespace"""
+        # Only ship the dataset when it isn't the one the worker already has
+        send_df = not self._df_synced or df is not self._df_sent
+        self._start('execute', cell_id, code_str, (cell_id, code_str, send_df, df if send_df else None))
+        self._df_sent = df
+        self._df_synced = True
+
+    def submit_isolated(self, cell_id, code_str, inputs):
+        """Run a cell in a fresh namespace seeded with pickled inputs"""
+        self._start('isolated', cell_id, code_str, (cell_id, code_str, inputs))
+
+    def poll(self, timeout):
+        """Collect waiting messages; return the pending run's response once it's done"""
+        try:
+            ready = self.conn.poll(timeout)
+            while ready:
+                kind, run_id, payload = self.conn.recv()
+                if kind == 'ready':
+                    self._ready = True
+                    if self._interrupt_requested:
+                        self.interrupt()
+                # Messages for an abandoned run are dropped
+                elif self.pending is not None and run_id == self.pending['run_id']:
+                    if kind == 'done':
+                        self.pending = None
+                        if 'df' in payload:
+                            self._df_sent = payload['df']
+                        return payload
+                    self.pending['output'].write(payload)
+                ready = self.conn.poll()
+        except (EOFError, OSError):
+            # The process is gone; alive() reports it
+            pass
+        except Exception:
+            # A garbled message (e.g. UnpicklingError); the pipe can't be
+            # trusted any more, so stop the process and let alive() report it
+            self.process.kill()
+            self.process.wait()
+        return None
+
+    def pending_output(self):
+        return self.pending['output'].getvalue() if self.pending else ''
+
+    def interrupt(self):
+        if not self.alive() or self.pending is None:
+            return
+        if not self._ready:
+            # Sent once the process has started (see poll())
+            self._interrupt_requested = True
+            return
+        self._interrupt_requested = False
+        os.kill(self.process.pid, signal.SIGINT)
+
+    def shutdown(self):
+        self._finalizer()
+
+
+def _forget_kernel_state():
+    """Cells have to re-run after the kernel's namespace is lost"""
+    for cell in st.session_state.cells:
+        cell['run_digest'] = None
+
+
+def get_worker():
+    """The session's kernel worker, (re)started if it isn't running"""
+    worker = st.session_state.get('kernel_worker')
+    if worker is None or not worker.alive():
+        if worker is not None:
+            _forget_kernel_state()
+        worker = st.session_state.kernel_worker = KernelWorker()
+    return worker
+
+
+def restart_worker():
+    worker = st.session_state.get('kernel_worker')
+    if worker is not None:
+        worker.shutdown()
+    st.session_state.kernel_worker = None
+    _forget_kernel_state()
+
+
+def wait_for_worker(worker):
+    """Block until the pending run finishes, showing elapsed time and output so far.
+
+    The status updates give Streamlit a point to interrupt this loop when the
+    user clicks something; the run keeps going in the worker and is picked up
+    again on the next script run.
+    """
+    status = st.empty()
+    while True:
+        response = worker.poll(WORKER_POLL_INTERVAL)
+        if response is not None:
+            status.empty()
+            return response
+        if not worker.alive():
+            pending, worker.pending = worker.pending, None
+            status.empty()
+            return {
+                'cell_id': pending['cell_id'],
+                'code': pending['code'],
+                'fields': None,
+                'error': "The kernel process died while running this cell",
+                'error_traceback': None
+            }
+        show_running(status, worker.pending['started'], worker.pending_output())
+
+
+def show_running(placeholder, started, output):
+    """Elapsed time and the tail of the output so far for a running cell"""
+    with placeholder.container():
+        st.caption(f"⏳ Running... {time.monotonic() - started:.0f}s")
+        if output:
+            st.text(output[-RUNNING_PREVIEW_CHARS:])
+
+
+if __name__ == '__main__':
+    _worker_main(Connection(int(sys.argv[1])))
@@ -0,0 +1,174 @@
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from config import MEMO_FULL_HASH_MAX_ROWS, MEMO_SAMPLE_ROWS, MEMO_FULL_HASH_MAX_ITEMS, MEMO_SAMPLE_ITEMS
+from namespace import is_user_name
+
+# The result fields of a cell dict, filled the same way by every kernel path.
+# 'displays' replaces the old 'result', 'dataframe', 'series' and 'figure'
+# fields: a cell can show several values, and the kind of each is
+# Display.kind ('dataframe', 'series', 'figure', 'value', ...)
+RESULT_FIELDS = ('output', 'output_spill', 'displays')
+
+
+def _sample_rows(obj):
+    """Evenly spaced rows of a large frame/array, always including the ends"""
+    if len(obj) <= MEMO_FULL_HASH_MAX_ROWS:
+        return obj
+    positions = np.linspace(0, len(obj) - 1, MEMO_SAMPLE_ROWS).astype(np.int64)
+    return obj.iloc[positions] if isinstance(obj, (pd.DataFrame, pd.Series)) else obj[positions]
+
+
+def _sample_items(value):
+    """Evenly spaced items of a large container, always including the ends"""
+    positions = np.linspace(0, len(value) - 1, MEMO_SAMPLE_ITEMS).astype(np.int64)
+    if isinstance(value, (list, tuple)):
+        return [value[i] for i in positions]
+    wanted = set(positions.tolist())
+    items = value.items() if isinstance(value, dict) else value
+    return [item for i, item in enumerate(items) if i in wanted]
+
+
+def fingerprint(value, _depth=0):
+    """Cheap content fingerprint used to tell whether a cell's inputs changed.
+
+    Frames, series and arrays are hashed in full up to MEMO_FULL_HASH_MAX_ROWS
+    rows and by an evenly spaced sample beyond that. Containers are hashed
+    by value up to MEMO_FULL_HASH_MAX_ITEMS items and by their length plus
+    a sample beyond that, so appending to a long list changes the
+    fingerprint. Scalars are hashed by value; anything else (and containers
+    nested too deep) falls back to identity, see memo_key().
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((value.shape, list(value.dtypes.items()) if isinstance(value, pd.DataFrame) else value.dtype)).encode())
+        try:
+            digest.update(pd.util.hash_pandas_object(_sample_rows(value), index=True).values.tobytes())
+        except TypeError:
+            # Unhashable cells (lists, dicts) in object columns
+            return ('id', id(value), value.shape)
+        return ('pandas', digest.hexdigest())
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return ('id', id(value), value.shape)
+        sample = np.ascontiguousarray(_sample_rows(value) if value.ndim else value)
+        return ('ndarray', value.shape, str(value.dtype), hashlib.blake2b(sample.tobytes(), digest_size=16).hexdigest())
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogatepass')
+    if isinstance(value, bytes):
+        return ('bytes', hashlib.blake2b(value, digest_size=16).hexdigest())
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        return ('value', type(value).__name__, value)
+    if isinstance(value, (list, tuple, set, frozenset, dict)) and _depth < 3:
+        if len(value) > MEMO_FULL_HASH_MAX_ITEMS:
+            return (type(value).__name__, len(value), tuple(fingerprint(item, _depth + 1) for item in _sample_items(value)))
+        items = value.items() if isinstance(value, dict) else value
+        if isinstance(value, (set, frozenset, dict)):
+            items = sorted(items, key=repr)
+        return (type(value).__name__, tuple(fingerprint(item, _depth + 1) for item in items))
+    return ('id', type(value).__name__, id(value))
+
+
+def estimate_size(value):
+    """Approximate bytes held by a value, without walking arbitrary object graphs"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum() if isinstance(value, pd.DataFrame) else value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+def _fields_size(fields):
+    """Bytes held by a cell's result fields; displays are sized by their values, as the result store does"""
+    from results import value_size
+    size = 0
+    for field, value in fields.items():
+        if value is None:
+            continue
+        if field == 'displays':
+            size += sum(value_size(display.value) for display in value)
+        else:
+            size += estimate_size(value)
+    return size
+
+
+class ResultMemo:
+    """Per-session LRU of cell results keyed by code digest plus input fingerprints"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        # Stored bindings are shared with the namespace, so a later cell may
+        # have mutated them in place; such an entry can't be replayed
+        for name, value in entry['bindings'].items():
+            if fingerprint(value) != entry['binding_fingerprints'][name]:
+                self.discard(key)
+                return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, fields, bindings):
+        entry = {
+            'fields': fields,
+            'bindings': bindings,
+            'binding_fingerprints': {name: fingerprint(value) for name, value in bindings.items()},
+            'size': _fields_size(fields) + sum(estimate_size(v) for v in bindings.values() if v is not None)
+        }
+        if entry['size'] > self.max_bytes:
+            return
+        self.discard(key)
+        self._entries[key] = entry
+        self._total_bytes += entry['size']
+        while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= evicted['size']
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry['size']
+
+    def discard_holding(self, value):
+        """Drop the entries that keep value alive, as a binding or as a cell's displays list"""
+        for key, entry in list(self._entries.items()):
+            if entry['fields'].get('displays') is value or any(v is value for v in entry['bindings'].values()):
+                self.discard(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._total_bytes = 0
+
+
+def _by_identity(digest):
+    """Whether a fingerprint, or any part of it, only records an object's identity"""
+    return isinstance(digest, tuple) and (digest[:1] == ('id',) or any(_by_identity(part) for part in digest))
+
+
+def memo_key(compiled, namespace, stamps):
+    """Key a run on the compiled code plus fingerprints of the user names it reads.
+
+    An object fingerprinted by identity looks the same after a method call
+    changed it in place, so its key also holds the newest run stamp of a
+    cell that wrote or may have mutated the name (stamps, see
+    cell_manager.write_stamps()).
+    """
+    inputs = []
+    for name in compiled.reads:
+        if name not in namespace or not is_user_name(name):
+            continue
+        digest = fingerprint(namespace[name])
+        if _by_identity(digest):
+            digest = (digest, stamps.get(name))
+        inputs.append((name, digest))
+    return (compiled.digest, tuple(sorted(inputs)))
@@ -0,0 +1,69 @@
+import builtins
+import streamlit as st
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import charts
+
+# Names the kernel provides to every cell; they aren't user variables
+KERNEL_NAMES = frozenset({'__builtins__', 'pd', 'np', 'px', 'go', 'charts', 'st', 'print'})
+
+
+class Namespace(dict):
+    """Persistent exec() globals that record which names each run binds or deletes.
+
+    Module-level assignments in exec'd code go through __setitem__ because
+    this isn't an exact dict, so `changed` ends up holding exactly the names
+    a run (re)bound. Values injected by the kernel itself use inject() and
+    aren't reported.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # dicts used as insertion-ordered sets
+        self.changed = {}
+        self.deleted = {}
+
+    def __setitem__(self, name, value):
+        super().__setitem__(name, value)
+        self.changed[name] = None
+        self.deleted.pop(name, None)
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.deleted[name] = None
+        self.changed.pop(name, None)
+
+    def begin_run(self):
+        self.changed = {}
+        self.deleted = {}
+
+    def inject(self, name, value):
+        """Set a value without counting it as a change made by the cell"""
+        super().__setitem__(name, value)
+
+    def user_items(self):
+        """(name, value) pairs for user variables, skipping kernel and private names"""
+        return [(name, value) for name, value in self.items() if is_user_name(name)]
+
+
+def is_user_name(name):
+    return name not in KERNEL_NAMES and not name.startswith('_')
+
+
+def new_namespace():
+    """A fresh kernel namespace with the default imports"""
+    namespace = Namespace()
+    for name, value in {
+        '__builtins__': builtins,
+        'pd': pd,
+        'np': np,
+        'px': px,
+        'go': go,
+        'charts': charts,
+        'st': st,
+        'print': print
+    }.items():
+        namespace.inject(name, value)
+    return namespace
@@ -0,0 +1,93 @@
+import queue
+import threading
+import streamlit as st
+from config import PARALLEL_MAX_WORKERS, WORKER_POLL_INTERVAL
+from kernel_worker import KernelWorker
+
+
+class WorkerPool:
+    """Process-wide pool of kernel workers used for parallel Run All.
+
+    Workers start lazily, up to `size`, and are shared by every session.
+    Runs on them are isolated, so a worker holds no state between tasks.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, block=True):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    if self._started < self.size:
+                        self._started += 1
+                        return KernelWorker()
+                if not block:
+                    return None
+                worker = self._idle.get()
+            if worker.alive():
+                return worker
+            self._discard(worker)
+
+    def release(self, worker):
+        if worker.alive() and worker.pending is None:
+            self._idle.put(worker)
+        else:
+            # Still busy with a run nobody will collect; don't hand it out again
+            worker.shutdown()
+            self._discard(worker)
+
+    def _discard(self, worker):
+        with self._lock:
+            self._started -= 1
+
+
+worker_pool = WorkerPool(PARALLEL_MAX_WORKERS)
+
+
+def run_isolated(tasks):
+    """Run (cell_id, code, pickled_inputs) tasks concurrently on the pool.
+
+    Returns the responses in task order. While waiting a status line shows
+    progress; if the script is interrupted the busy workers are dropped.
+    """
+    responses = [None] * len(tasks)
+    waiting = list(enumerate(tasks))
+    running = {}
+    status = st.empty()
+    try:
+        while waiting or running:
+            # Always hold at least one worker so the run makes progress
+            while waiting:
+                worker = worker_pool.acquire(block=not running)
+                if worker is None:
+                    break
+                index, (cell_id, code_str, inputs) = waiting.pop(0)
+                worker.submit_isolated(cell_id, code_str, inputs)
+                running[index] = worker
+
+            for index, worker in list(running.items()):
+                response = worker.poll(WORKER_POLL_INTERVAL / max(len(running), 1))
+                if response is None and not worker.alive():
+                    response = {
+                        'cell_id': tasks[index][0], 'code': tasks[index][1], 'fields': None,
+                        'bindings': {}, 'rerun': False,
+                        'error': "The worker process died while running this cell", 'error_traceback': None
+                    }
+                if response is not None:
+                    responses[index] = response
+                    del running[index]
+                    worker_pool.release(worker)
+
+            done = len(tasks) - len(waiting) - len(running)
+            status.caption(f"⚡ Running cells in parallel... {done}/{len(tasks)} done")
+    finally:
+        for worker in running.values():
+            worker_pool.release(worker)
+        status.empty()
+    return responses
@@ -0,0 +1,96 @@
+import weakref
+import streamlit as st
+import pandas as pd
+from config import PREVIEW_PAGE_ROWS, PREVIEW_MAX_ROWS, PREVIEW_MAX_COLUMNS
+
+_ORIGINAL_ORDER = "(original order)"
+
+
+def _sort_positions(frame, source, key, column, ascending):
+    """Row positions of frame sorted by column, cached per preview so paging doesn't re-sort.
+
+    source is the object the cell returned; frame may be a view built from it.
+    """
+    orders = st.session_state.setdefault('preview_orders', {})
+    cached = orders.get(key)
+    if cached is not None and cached['source']() is source and cached['sort'] == (column, ascending):
+        return cached['positions']
+    positions = (
+        frame[column].reset_index(drop=True)
+        .sort_values(ascending=ascending, kind='stable', na_position='last')
+        .index.to_numpy()
+    )
+    # A weak reference, so the cache doesn't keep a replaced or spilled result alive
+    orders[key] = {'source': weakref.ref(source), 'sort': (column, ascending), 'positions': positions}
+    return positions
+
+
+def _rows_shown(key, version):
+    shown_version, shown = st.session_state.setdefault('preview_rows', {}).get(key, (None, PREVIEW_PAGE_ROWS))
+    return shown if shown_version == version else PREVIEW_PAGE_ROWS
+
+
+def _load_more(key, version):
+    shown = _rows_shown(key, version)
+    st.session_state.preview_rows[key] = (version, min(shown + PREVIEW_PAGE_ROWS, PREVIEW_MAX_ROWS))
+
+
+def render_frame_preview(frame, key, version):
+    """Paged view of a DataFrame or Series that only sends the visible rows to the browser.
+
+    Sorting and column selection happen here on the server; the browser
+    gets at most PREVIEW_MAX_ROWS rows of the chosen columns. key names
+    the preview (one per cell); version changes with the frame (e.g. the
+    execution count) so the controls start fresh for a new result.
+    """
+    source = frame
+    if isinstance(frame, pd.Series):
+        frame = frame.to_frame()
+    if len(frame) <= PREVIEW_PAGE_ROWS and len(frame.columns) <= PREVIEW_MAX_COLUMNS:
+        st.dataframe(frame, use_container_width=True)
+        return
+
+    columns = list(frame.columns)
+    widget_key = f"{key}_{version}"
+    col1, col2, col3 = st.columns([3, 2, 1])
+    selected = col1.multiselect(
+        "Columns",
+        columns,
+        default=columns[:PREVIEW_MAX_COLUMNS],
+        key=f"{widget_key}_columns",
+        format_func=str
+    )
+    sort_by = col2.selectbox("Sort by", [_ORIGINAL_ORDER] + columns, key=f"{widget_key}_sort", format_func=str)
+    ascending = col3.toggle("Ascending", value=True, key=f"{widget_key}_ascending")
+
+    shown = _rows_shown(key, version)
+    start = st.number_input(
+        "First row",
+        min_value=1,
+        max_value=max(1, len(frame)),
+        value=1,
+        step=shown,
+        key=f"{widget_key}_start"
+    ) - 1
+    stop = min(start + shown, len(frame))
+
+    if sort_by == _ORIGINAL_ORDER:
+        window = frame.iloc[start:stop]
+    else:
+        try:
+            window = frame.iloc[_sort_positions(frame, source, key, sort_by, ascending)[start:stop]]
+        except TypeError:
+            st.warning(f"⚠️ Column {sort_by!r} holds values that can't be compared, so it can't be sorted")
+            window = frame.iloc[start:stop]
+    st.dataframe(window[selected or columns[:1]], use_container_width=True)
+
+    col1, col2 = st.columns([3, 1])
+    col1.caption(f"Rows {start + 1:,}–{stop:,} of {len(frame):,} · {len(selected)} of {len(columns)} columns")
+    if stop < len(frame) and shown < PREVIEW_MAX_ROWS:
+        col2.button(
+            "⬇️ Load more",
+            key=f"{widget_key}_more",
+            on_click=_load_more,
+            args=(key, version),
+            use_container_width=True
+        )
@@ -0,0 +1,173 @@
+"""Per-session memory budget for the values cells display.
+
+Cells keep their displays (frames, arrays, figures) in session state. Once
+the displays of all cells add up to more than the budget, the values of the
+least recently shown cells are pickled to temp files and reloaded when the
+cell is drawn again.
+"""
+import pickle
+import weakref
+import tempfile
+from collections import OrderedDict
+from plotly.basedatatypes import BaseFigure
+from capture import _remove_file
+from display import Display
+from figures import FigureSpec
+from memo import estimate_size
+from config import RESULT_SPILL_MIN_BYTES
+
+_FIGURE_ARRAYS = ('x', 'y', 'z', 'text', 'customdata')
+
+
+class SpilledValue:
+    """A display value pickled to a temp file; the file goes with the last reference"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size  # bytes the value took in memory
+        weakref.finalize(self, _remove_file, path)
+
+    def load(self):
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+
+def value_size(value):
+    """Bytes a display value holds in memory; figures count the data arrays of their traces"""
+    if isinstance(value, FigureSpec):
+        return len(value.json)
+    if isinstance(value, BaseFigure):
+        # Traces hold their data as arrays or tuples
+        return sum(
+            estimate_size(data) if hasattr(data, 'nbytes') else 8 * len(data)
+            for trace in value.data
+            for data in (getattr(trace, name, None) for name in _FIGURE_ARRAYS)
+            if data is not None and not isinstance(data, str)
+        )
+    return estimate_size(value)
+
+
+def _spill(display, size, spilled=None):
+    """The display with its value written to a temp file, or unchanged if it's small or can't be pickled.
+
+    spilled is the file the value was reloaded from, if any; it's reused
+    rather than written again.
+    """
+    if isinstance(display.value, SpilledValue):
+        return display
+    if spilled is not None:
+        return display._replace(value=spilled)
+    if size < RESULT_SPILL_MIN_BYTES:
+        return display
+    fd, path = tempfile.mkstemp(prefix='notebook-result-', suffix='.pkl')
+    try:
+        with open(fd, 'wb') as f:
+            pickle.dump(display.value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        _remove_file(path)
+        return display
+    return display._replace(value=SpilledValue(path, size))
+
+
+def _reload(display):
+    try:
+        return display._replace(value=display.value.load())
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return Display('value', "(result no longer available, run the cell again)", display.label, None)
+
+
+class ResultStore:
+    """LRU of cell displays held in memory, by cell id, within max_bytes.
+
+    The store works on the cell's own displays list, replacing values in
+    place, so other holders of the list (the result memo) see the same
+    spilled or reloaded values. Reloaded values keep their file, so they
+    aren't pickled again when spilled a second time.
+
+    shared() returns the values also held outside the store (the
+    namespace's variables). Spilling those would free nothing, so they
+    are neither spilled nor counted. on_spill(cell_id) is called after a
+    cell is spilled, to drop caches built from its values.
+
+    Cells drawn during the current or previous pass of the page (see
+    begin_pass()) aren't spilled, nor is the cell just put. When more is
+    on screen than fits the budget, the store goes over it rather than
+    reading the same files back on every rerun.
+    """
+
+    def __init__(self, max_bytes, shared=None, on_spill=None):
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.on_spill = on_spill
+        # cell id -> {'displays': list, 'sizes': bytes per display,
+        #             'files': SpilledValue or None per display, 'pass': last pass it was drawn in, or None}
+        self._entries = OrderedDict()
+        self._pass = 0
+
+    def begin_pass(self):
+        """Start a full redraw of the page"""
+        self._pass += 1
+
+    def put(self, cell_id, displays):
+        """Track a cell's new displays as the most recently used"""
+        self.discard(cell_id)
+        if not displays:
+            return
+        sizes = [
+            display.value.size if isinstance(display.value, SpilledValue) else value_size(display.value)
+            for display in displays
+        ]
+        self._entries[cell_id] = {'displays': displays, 'sizes': sizes, 'files': [None] * len(displays), 'pass': None}
+        self._shrink(cell_id)
+
+    def load(self, cell_id, displays):
+        """The cell's displays with any spilled values read back in"""
+        entry = self._entries.get(cell_id)
+        if entry is None or entry['displays'] is not displays:
+            self.put(cell_id, displays)
+            entry = self._entries.get(cell_id)
+            if entry is None:
+                return displays
+        self._entries.move_to_end(cell_id)
+        entry['pass'] = self._pass
+        if any(isinstance(display.value, SpilledValue) for display in displays):
+            for i, display in enumerate(displays):
+                if isinstance(display.value, SpilledValue):
+                    entry['files'][i] = display.value
+                    displays[i] = _reload(display)
+            self._shrink(cell_id)
+        return displays
+
+    def discard(self, cell_id):
+        self._entries.pop(cell_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _shrink(self, keep):
+        """Spill the least recently used cells until the rest fit, never keep or the ones on screen"""
+        held = {id(value) for value in self.shared()} if self.shared is not None else set()
+
+        def in_memory(entry):
+            return sum(
+                size for display, size in zip(entry['displays'], entry['sizes'])
+                if not isinstance(display.value, SpilledValue) and id(display.value) not in held
+            )
+
+        total = sum(in_memory(entry) for entry in self._entries.values())
+        for cell_id, entry in list(self._entries.items()):
+            if total <= self.max_bytes:
+                break
+            if cell_id == keep or (entry['pass'] is not None and entry['pass'] >= self._pass - 1):
+                continue
+            before = in_memory(entry)
+            if not before:
+                continue
+            displays = entry['displays']
+            displays[:] = [
+                display if id(display.value) in held else _spill(display, size, spilled)
+                for display, size, spilled in zip(displays, entry['sizes'], entry['files'])
+            ]
+            total -= before - in_memory(entry)
+            if self.on_spill is not None:
+                self.on_spill(cell_id)
@@ -0,0 +1,110 @@
+"""Namespace snapshots taken after cells marked for it, to rewind the notebook to that point.
+
+A snapshot holds the user variables as they were right after the cell
+ran. Values are shared with the namespace rather than copied up front:
+pandas objects are shallow copies (copy-on-write in pandas 3), and other
+mutable values are copied only when a later cell that uses them is about
+to run, since method calls like `x.append(...)` can change them in place.
+Snapshots are only charged for the values the namespace no longer shares
+with them, and the oldest are evicted past max_bytes.
+"""
+import copy
+import types
+import pandas as pd
+from collections import OrderedDict
+from memo import estimate_size
+from namespace import new_namespace
+
+# Values a cell can't change in place, or that aren't worth copying
+_SHARED_TYPES = (
+    int, float, complex, bool, str, bytes, type(None), frozenset, range, type,
+    types.ModuleType, types.FunctionType, types.BuiltinFunctionType
+)
+
+
+def _detach(value):
+    """A copy of value that later in-place changes to the original won't reach"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    return copy.deepcopy(value)
+
+
+class SnapshotStore:
+    """Per-session snapshots by cell id, evicted oldest first within max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        # cell id -> {'stamp': run stamp of the cell, 'values': name -> value,
+        #             'origins': name -> namespace object the value was taken from,
+        #             'sizes': name -> bytes, for values no longer shared}
+        self._snapshots = OrderedDict()
+
+    def take(self, cell_id, stamp, namespace):
+        values = {}
+        origins = {}
+        for name, value in namespace.user_items():
+            # Frames are cheap to detach now; other values are copied before a cell uses them
+            values[name] = value.copy(deep=False) if isinstance(value, (pd.DataFrame, pd.Series)) else value
+            origins[name] = value
+        self._snapshots.pop(cell_id, None)
+        self._snapshots[cell_id] = {'stamp': stamp, 'values': values, 'origins': origins, 'sizes': {}}
+        self._shrink(namespace)
+
+    def before_run(self, namespace, names):
+        """Copy the values a cell is about to use out of the snapshots that share them"""
+        for cell_id, snapshot in list(self._snapshots.items()):
+            for name in names:
+                value = snapshot['values'].get(name)
+                if name not in namespace or value is not namespace[name] or isinstance(value, _SHARED_TYPES):
+                    continue
+                try:
+                    snapshot['values'][name] = _detach(value)
+                    # No longer shared, so it counts towards the budget
+                    snapshot['origins'][name] = None
+                except Exception:
+                    # Can't be copied, so the snapshot can't be kept intact
+                    del self._snapshots[cell_id]
+                    break
+        self._shrink(namespace)
+
+    def stamp(self, cell_id):
+        snapshot = self._snapshots.get(cell_id)
+        return snapshot['stamp'] if snapshot is not None else None
+
+    def restore(self, cell_id):
+        """A namespace holding the snapshot's variables, which stays usable for the next restore"""
+        snapshot = self._snapshots[cell_id]
+        namespace = new_namespace()
+        for name, value in snapshot['values'].items():
+            namespace.inject(name, value)
+            # The namespace now shares the value; a later write copies it out again
+            snapshot['origins'][name] = value
+            snapshot['sizes'].pop(name, None)
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                snapshot['values'][name] = value.copy(deep=False)
+        self._snapshots.move_to_end(cell_id)
+        return namespace
+
+    def discard(self, cell_id):
+        self._snapshots.pop(cell_id, None)
+
+    def clear(self):
+        self._snapshots.clear()
+
+    def _cost(self, snapshot, namespace):
+        """Bytes held only because of this snapshot (approximately)"""
+        total = 0
+        for name, value in snapshot['values'].items():
+            if name in namespace and namespace[name] is snapshot['origins'][name]:
+                continue
+            if name not in snapshot['sizes']:
+                snapshot['sizes'][name] = estimate_size(value)
+            total += snapshot['sizes'][name]
+        return total
+
+    def _shrink(self, namespace):
+        while self._snapshots:
+            total = sum(self._cost(snapshot, namespace) for snapshot in self._snapshots.values())
+            if total <= self.max_bytes:
+                break
+            self._snapshots.popitem(last=False)
@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+from data_loader import compact_frame
+
+
+@pytest.mark.parametrize('values', [
+    ['1.2.3', '1.2.4', '2.0.1'],
+    ['01-02-03', '04-05-06', '07-08-09'],
+    ['2024-1-5', '2024-01-06', '2024-1-7'],
+    ['2024-13-45', '2024-01-01', '2024-01-02'],
+    ['2024-01-05 note', '2024-01-06', '2024-01-07'],
+])
+def test_text_that_isnt_a_consistent_date_stays_text(values):
+    df, report = compact_frame(pd.DataFrame({'col': values}))
+    assert not pd.api.types.is_datetime64_any_dtype(df['col'])
+    assert df['col'].astype(str).tolist() == values
+
+
+@pytest.mark.parametrize('values', [
+    ['2024-01-05', '2024-02-06', None],
+    ['01/05/2024', '02/06/2024', '12/31/2024'],
+    ['2024-01-05 10:00:00', '2024-01-05 11:30:00', '2024-01-06 00:00:00'],
+])
+def test_dates_in_one_format_become_datetimes(values):
+    df, report = compact_frame(pd.DataFrame({'col': values}))
+    assert pd.api.types.is_datetime64_any_dtype(df['col'])
+    assert report['changes']['col'][1].startswith('datetime64')
+    assert df['col'].iloc[1] == pd.Timestamp(values[1])
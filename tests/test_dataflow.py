@@ -0,0 +1,133 @@
+import pytest
+from compiler import compile_cell
+from dataflow import is_stale, plan_run, parallel_stages
+
+
+def names(code):
+    compiled = compile_cell(code)
+    return set(compiled.reads), set(compiled.writes)
+
+
+@pytest.mark.parametrize('code, reads, writes', [
+    ("x = 1\nprint(x)", {'print'}, {'x'}),
+    ("y = x + 1", {'x'}, {'y'}),
+    ("x += 1", {'x'}, {'x'}),
+    ("total += df['a'].sum()", {'total', 'df'}, {'total'}),
+    ("df['b'] = df['a'] * 2", {'df'}, {'df'}),
+    ("df.loc[0, 'a'] = 0", {'df'}, {'df'}),
+    ("obj.attr = 1", {'obj'}, {'obj'}),
+    ("obj.inner.attr = 1", {'obj'}, {'obj'}),
+    ("del d['k']", {'d'}, {'d'}),
+    ("del x", set(), {'x'}),
+    ("df.dropna(inplace=True)", {'df'}, {'df'}),
+    ("df.dropna()", {'df'}, set()),
+    ("def f():\n    global g\n    g = 1", set(), {'f', 'g'}),
+])
+def test_reads_and_writes(code, reads, writes):
+    assert names(code) == (reads, writes)
+
+
+@pytest.mark.parametrize('code, mutates', [
+    ("lst.append(2)", {'lst'}),
+    ("item = lst.pop()", {'lst'}),
+    ("obj.items[0].append(1)", {'obj'}),
+    ("ax.set_title('x')\nfig", {'ax'}),
+    ("for v in values:\n    seen.add(v)", {'seen'}),
+    ("df.describe()", set()),
+    ("summary = df.groupby('a').size()", set()),
+    ("lst = []\nlst.append(1)", set()),
+])
+def test_method_calls_that_may_mutate(code, mutates):
+    compiled = compile_cell(code)
+    # Whether they do depends on the value, so they aren't writes themselves
+    assert set(compiled.mutates) == mutates
+    assert not compiled.writes & compiled.mutates
+
+
+def _cells(*codes, stamps=None):
+    cells = []
+    for i, code in enumerate(codes):
+        compiled = compile_cell(code)
+        stamp = stamps[i] if stamps else None
+        cells.append({
+            'id': i, 'content': code, 'executed': stamp is not None,
+            'run_digest': compiled.digest if stamp is not None else None, 'run_stamp': stamp
+        })
+    return cells, [compile_cell(code) for code in codes]
+
+
+def test_later_writer_does_not_make_earlier_reader_stale():
+    cells, compiled = _cells("print(df.shape)", "df['x'] = 1", stamps=[1, 2])
+    assert plan_run(cells, compiled, {}) == []
+
+
+def test_upstream_write_makes_reader_stale():
+    cells, compiled = _cells("df['x'] = 1", "print(df.shape)", stamps=[3, 2])
+    assert is_stale(cells[1], compiled[1], {'df': 3})
+    assert plan_run(cells, compiled, {}) == [cells[1]]
+
+
+def test_external_write_and_dependents_run():
+    cells, compiled = _cells("y = df['a'] * 2", "z = y.sum()", "w = 1", stamps=[1, 2, 3])
+    plan = plan_run(cells, compiled, {'df': 5})
+    assert [cell['id'] for cell in plan] == [0, 1]
+
+
+def test_rerun_method_call_mutation_makes_readers_stale():
+    cells, compiled = _cells("lst = [1]", "lst.append(2)", "print(len(lst))", stamps=[1, 2, 3])
+    cells[1]['run_digest'] = 'old'
+    assert plan_run(cells, compiled, {}, {'lst'}) == cells[1:]
+    # Unless the value can't change in place
+    assert plan_run(cells, compiled, {}) == [cells[1]]
+
+
+def test_cells_that_never_ran_or_changed_run():
+    cells, compiled = _cells("a = 1", "b = 2", stamps=[None, 1])
+    cells[1]['run_digest'] = 'old'
+    assert plan_run(cells, compiled, {}) == cells
+
+
+def _stage_ids(cells, compiled, mutable=frozenset()):
+    return [[cell['id'] for cell, _ in stage] for stage in parallel_stages(cells, compiled, mutable)]
+
+
+def test_independent_cells_share_a_stage():
+    cells, compiled = _cells("a = 1", "b = 2", "c = a + b")
+    assert _stage_ids(cells, compiled) == [[0, 1], [2]]
+
+
+def test_cells_writing_the_same_name_never_share_a_stage():
+    cells, compiled = _cells("x = 1", "x = 2")
+    assert _stage_ids(cells, compiled) == [[0], [1]]
+
+
+def test_writer_of_a_read_name_may_share_the_readers_stage():
+    cells, compiled = _cells("print(x)", "x = 2")
+    assert _stage_ids(cells, compiled) == [[0, 1]]
+
+
+def test_cells_sharing_a_mutable_input_run_in_order():
+    cells, compiled = _cells(
+        "lst = [1]\ndf = pd.DataFrame({'a': [1]})",
+        "lst.append(2)",
+        "df.insert(0, 'n', 1)",
+        "print(len(lst), df.columns.tolist())"
+    )
+    assert _stage_ids(cells, compiled) == [[0], [1, 2, 3]]
+    assert _stage_ids(cells, compiled, {'lst', 'df'}) == [[0], [1, 2], [3]]
+
+
+def test_cells_only_reading_a_mutable_input_share_a_stage():
+    cells, compiled = _cells(
+        "df = pd.read_csv('data.csv')",
+        "df['a'].mean()",
+        "df.groupby('b').size()",
+        "charts.histogram(df, 'a')"
+    )
+    assert _stage_ids(cells, compiled, {'df'}) == [[0], [1, 2, 3]]
+
+
+def test_unparsable_cells_go_first():
+    cells, compiled = _cells("a = 1", "b = a")
+    compiled[1] = None
+    assert _stage_ids(cells, compiled) == [[0, 1]]
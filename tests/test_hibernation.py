@@ -0,0 +1,44 @@
+import gc
+import os
+import hibernation
+from streamlit.testing.v1 import AppTest
+
+
+def _app():
+    import streamlit as st
+    from config import initialize_session_state
+    from cell_manager import add_cell, execute_cell
+    from hibernation import session_activity
+
+    initialize_session_state()
+    with session_activity():
+        if not st.session_state.cells:
+            add_cell("values = list(range(1000))\ntotal = sum(values)\ntotal")
+            for cell in st.session_state.cells:
+                execute_cell(cell['id'], cell['content'])
+        st.text(repr(sorted(name for name, _ in st.session_state.variables.user_items())))
+
+
+def test_idle_session_is_hibernated_and_woken(tmp_path, monkeypatch):
+    monkeypatch.setattr(hibernation, 'HIBERNATE_DIR', str(tmp_path))
+    monkeypatch.setattr(hibernation, 'HIBERNATE_IDLE_MINUTES', 0)
+    monkeypatch.setattr(hibernation, '_sessions', {})
+    at = AppTest.from_function(_app).run(timeout=30)
+    assert at.text[-1].value == "['df', 'total', 'values']"
+    # The per-run session state wrapper is gone by now
+    gc.collect()
+
+    assert hibernation.hibernate_idle_sessions() == 1
+    session = next(iter(hibernation._sessions.values()))['state']
+    assert session['hibernation']['asleep']
+    assert not list(session['variables'].user_items())
+    assert session['cells'][0]['displays'] is None
+    assert os.listdir(tmp_path)
+
+    at.run(timeout=30)
+    assert not at.exception
+    assert at.text[-1].value == "['df', 'total', 'values']"
+    assert at.session_state.hibernation['count'] == 1
+    assert at.session_state.cells[0]['displays'][0].value == repr(sum(range(1000)))
+    assert at.session_state.variables['total'] == sum(range(1000))
+    assert not os.listdir(tmp_path)
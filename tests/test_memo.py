@@ -0,0 +1,60 @@
+from compiler import compile_cell
+from memo import fingerprint, memo_key
+from namespace import new_namespace
+
+
+class Model:
+    def __init__(self):
+        self.weights = []
+
+
+def _namespace(**values):
+    namespace = new_namespace()
+    for name, value in values.items():
+        namespace.inject(name, value)
+    return namespace
+
+
+def test_small_containers_are_fingerprinted_by_value():
+    assert fingerprint([1, {'a': (2, 3)}]) == fingerprint([1, {'a': (2, 3)}])
+    assert fingerprint({'b': 1, 'a': 2}) == fingerprint({'a': 2, 'b': 1})
+    assert fingerprint([1, 2]) != fingerprint([1, 3])
+
+
+def test_in_place_append_to_a_large_list_changes_the_fingerprint():
+    values = list(range(2000))
+    before = fingerprint(values)
+    assert fingerprint(list(range(2000))) == before
+    values.append(2000)
+    assert fingerprint(values) != before
+
+
+def test_in_place_change_to_a_large_dict_changes_the_fingerprint():
+    values = {i: i for i in range(2000)}
+    before = fingerprint(values)
+    values[1999] = -1
+    assert fingerprint(values) != before
+
+
+def test_memo_key_changes_after_a_large_list_is_mutated_in_place():
+    compiled = compile_cell("total = sum(values)")
+    namespace = _namespace(values=list(range(2000)))
+    key = memo_key(compiled, namespace, {'values': 1})
+    namespace['values'].append(1)
+    assert memo_key(compiled, namespace, {'values': 1}) != key
+
+
+def test_memo_key_of_an_object_follows_its_write_stamp():
+    compiled = compile_cell("score = len(model.weights)")
+    namespace = _namespace(model=Model())
+    key = memo_key(compiled, namespace, {'model': 1})
+    assert memo_key(compiled, namespace, {'model': 1}) == key
+    # Another cell ran model.weights.append(...)
+    namespace['model'].weights.append(1)
+    assert memo_key(compiled, namespace, {'model': 2}) != key
+
+
+def test_memo_key_ignores_stamps_of_values_fingerprinted_by_content():
+    compiled = compile_cell("total = sum(values)")
+    namespace = _namespace(values=[1, 2, 3])
+    assert memo_key(compiled, namespace, {'values': 1}) == memo_key(compiled, namespace, {'values': 2})
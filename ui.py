@@ -1,47 +1,171 @@
+import uuid
 import streamlit as st
-import pandas as pd
-from cell_manager import add_cell, delete_cell, execute_cell
+from cell_manager import (
+    add_cell, delete_cell, execute_cell, run_all, mark_changed, finish_worker_run, drop_variable, drop_cell_result,
+    can_rewind, rewind_to
+)
+from kernel_worker import restart_worker
 from export import export_to_ipynb
-from config import CODE_TEMPLATES
+from config import (
+    CODE_TEMPLATES, CSV_CHUNKED_THRESHOLD_BYTES, NOTEBOOK_COMPACT_MIN_CELLS, NOTEBOOK_WINDOW_CELLS, MEMORY_INSPECTOR_ROWS
+)
+from inspector import memory_report
+from checkpoint import checkpoint_exists, save_checkpoint, restore_checkpoint, delete_checkpoint
+from hibernation import track_activity
+from namespace import new_namespace
+from display import render_display, display_title
+from data_loader import dataset_key, load_dataset, upload_digest, is_xlsx, list_excel_sheets
 
 
-def render_sidebar():
-    with st.sidebar:
-        st.title("Quick Start")
-        
-        st.markdown("### 📁 Step 1: Upload Data")
-        uploaded_file = st.file_uploader(
-            "Choose your file", 
-            type=['csv', 'xlsx', 'xls'], 
-            help="Upload a CSV or Excel file to get started"
+def format_bytes(size):
+    """Human readable byte count"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _load_with_progress(uploaded_file, key, chunked=False, **options):
+    """Load an upload, showing a progress bar and a cancel button for chunked loads"""
+    if not chunked:
+        with st.spinner("Loading data..."):
+            return load_dataset(uploaded_file, key, **options)
+
+    progress_bar = st.progress(0.0, text="Loading data...")
+    cancel_slot = st.empty()
+    # Clicking cancel queues a rerun, which interrupts this script at the next
+    # progress update; the callback runs first and marks the key as cancelled
+    cancel_slot.button(
+        "⏹️ Cancel loading",
+        on_click=_cancel_ingest,
+        args=(key,),
+        use_container_width=True
+    )
+
+    def update_progress(fraction, rows):
+        progress_bar.progress(fraction, text=f"Loading data... {rows:,} rows")
+
+    loaded = load_dataset(uploaded_file, key, chunked=True, progress=update_progress, **options)
+    progress_bar.empty()
+    cancel_slot.empty()
+    return loaded
+
+
+@track_activity
+def _cancel_ingest(key):
+    st.session_state.ingest_cancelled = key
+
+
+def _excel_options(uploaded_file):
+    """Sheet and range pickers for .xlsx uploads"""
+    sheets = st.session_state.setdefault('excel_sheets', {})
+    digest = upload_digest(uploaded_file)
+    if digest not in sheets:
+        sheets[digest] = list_excel_sheets(uploaded_file)
+
+    options = {'sheet': st.selectbox("Sheet:", sheets[digest], help="Only the chosen sheet is read")}
+    with st.expander("📐 Sheet range (optional)"):
+        options['first_row'] = st.number_input("Header row", min_value=1, value=1, step=1)
+        last_row = st.number_input("Last row (0 = all)", min_value=0, value=0, step=1)
+        options['last_row'] = last_row or None
+        options['columns'] = st.text_input("Columns", placeholder="e.g. A:F").strip() or None
+    return options
+
+
+def _read_excel_args(options):
+    """pd.read_excel keyword arguments that read the same block as the sheet/range pickers"""
+    args = ""
+    if options.get('sheet'):
+        args += f", sheet_name={options['sheet']!r}"
+    first_row = options.get('first_row') or 1
+    if first_row > 1:
+        args += f", header={first_row - 1}"
+    if options.get('last_row'):
+        args += f", nrows={max(options['last_row'] - first_row, 0)}"
+    if options.get('columns'):
+        args += f", usecols={options['columns']!r}"
+    return args
+
+
+def render_upload(uploaded_file):
+    """Load the uploaded file into the session and seed the starter cells"""
+    options = {}
+    if is_xlsx(uploaded_file):
+        options = _excel_options(uploaded_file)
+
+    chunked = False
+    if uploaded_file.name.endswith('.csv'):
+        chunked = st.checkbox(
+            "Load in chunks",
+            value=uploaded_file.size > CSV_CHUNKED_THRESHOLD_BYTES,
+            help="Stream large CSV files in chunks with progress and lower peak memory"
         )
 
-        if uploaded_file is not None:
-            try:
-                if uploaded_file.name.endswith('.csv'):
-                    st.session_state.df = pd.read_csv(uploaded_file)
-                else:
-                    st.session_state.df = pd.read_excel(uploaded_file)
-                
-                st.success(f"✅ Loaded: {st.session_state.df.shape[0]} rows × {st.session_state.df.shape[1]} columns")
-                
-                with st.expander("📋 View Column Names"):
-                    for col in st.session_state.df.columns:
-                        st.text(f"• {col}")
-                
-                if not st.session_state.file_loaded:
-                    # Add imports cell
-                    imports_code = """# Import required libraries
+    compact = st.checkbox(
+        "Compact frame",
+        value=False,
+        help="Convert repeated text to categories, parse dates and downcast numbers to save memory"
+    )
+
+    # Chunking doesn't change the parsed result, so it isn't part of the key
+    key = dataset_key(uploaded_file, compact=compact, **options)
+    if st.session_state.ingest_cancelled == key:
+        st.info("⏹️ Loading was cancelled")
+        if st.button("🔁 Retry loading", use_container_width=True):
+            st.session_state.ingest_cancelled = None
+            st.rerun()
+        return
+
+    # Only (re)load when a different upload arrives, so reruns never
+    # clobber a df that cells have already modified
+    loaded_key = st.session_state.dataset_key
+    if loaded_key != key:
+        reload = True
+        # Same file, other compaction/sheet/range options: ask first
+        confirm = loaded_key is not None and loaded_key[0] == key[0]
+        if confirm:
+            st.warning("⚠️ The loading options changed. Reloading replaces `df`, including any changes your cells made to it.")
+            reload = st.button("🔁 Reload with these options", use_container_width=True)
+        if reload:
+            df, report = _load_with_progress(
+                uploaded_file, key, chunked=chunked, compact=compact, **options
+            )
+            st.session_state.df = df
+            st.session_state.dataset_report = report
+            mark_changed(['df'])
+            st.session_state.dataset_key = key
+            st.session_state.dataset_shape = st.session_state.df.shape
+            st.session_state.dataset_columns = list(st.session_state.df.columns)
+            if confirm:
+                st.rerun()
+
+    rows, columns = st.session_state.dataset_shape
+    st.success(f"✅ Loaded: {rows} rows × {columns} columns")
+    report = st.session_state.dataset_report
+    if report:
+        st.caption(
+            f"🗜️ Memory: {format_bytes(report['memory_before'])} → {format_bytes(report['memory_after'])} "
+            f"({len(report['changes'])} columns compacted)"
+        )
+
+    with st.expander("📋 View Column Names"):
+        for col in st.session_state.dataset_columns:
+            st.text(f"• {col}")
+    
+    if not st.session_state.file_loaded:
+        # Add imports cell
+        imports_code = """# Import required libraries
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go"""
-                    add_cell(content=imports_code, position=0)
-                    
-                    # Add data loading cell
-                    file_extension = uploaded_file.name.split('.')[-1].lower()
-                    if file_extension == 'csv':
-                        load_code = f"""# Load the data from CSV file
+        add_cell(content=imports_code, position=0)
+        
+        # Add data loading cell
+        file_extension = uploaded_file.name.split('.')[-1].lower()
+        if file_extension == 'csv':
+            load_code = f"""# Load the data from CSV file
 df = pd.read_csv('{uploaded_file.name}')
 
 # Display basic information
@@ -50,9 +174,9 @@ print(f'\\nColumn names: {{list(df.columns)}}')
 
 # Show first 5 rows
 df.head()"""
-                    else:
-                        load_code = f"""# Load the data from Excel file
-df = pd.read_excel('{uploaded_file.name}')
+        else:
+            load_code = f"""# Load the data from Excel file
+df = pd.read_excel('{uploaded_file.name}'{_read_excel_args(options)})
 
 # Display basic information
 print(f'✓ Loaded {{len(df)}} rows and {{len(df.columns)}} columns')
@@ -60,11 +184,26 @@ print(f'\\nColumn names: {{list(df.columns)}}')
 
 # Show first 5 rows
 df.head()"""
-                    
-                    add_cell(content=load_code, position=1)
-                    st.session_state.file_loaded = True
-                    st.rerun()
+        
+        add_cell(content=load_code, position=1)
+        st.session_state.file_loaded = True
+        st.rerun()
+
+
+def render_sidebar():
+    with st.sidebar:
+        st.title("Quick Start")
+        
+        st.markdown("### 📁 Step 1: Upload Data")
+        uploaded_file = st.file_uploader(
+            "Choose your file", 
+            type=['csv', 'xlsx', 'xls'], 
+            help="Upload a CSV or Excel file to get started"
+        )
 
+        if uploaded_file is not None:
+            try:
+                render_upload(uploaded_file)
             except Exception as e:
                 st.markdown(
                     f'<div class="error-msg">❌ Error loading file<br>{str(e)}</div>', 
@@ -132,22 +271,191 @@ df.head()"""
                     use_container_width=True,
                     help="Download processed data"
                 )
+
+        render_checkpoint_controls()
+
+        st.markdown("---")
+        render_kernel_controls()
+
+        st.markdown("---")
+        render_memory_inspector()
         
 
 
+def resume_checkpoint():
+    """Restore a new session from the checkpoint named in the URL (?notebook=...), once"""
+    if st.session_state.checkpoint_name is not None:
+        return
+    name = st.query_params.get('notebook')
+    st.session_state.checkpoint_name = name or ''
+    if name and not st.session_state.cells and checkpoint_exists(name):
+        restore_checkpoint(name)
+        st.toast("♻️ Restored the saved notebook")
+
+
+def render_checkpoint_controls():
+    """Save the session to disk so it can be reopened without re-running every cell"""
+    if st.session_state.kernel_mode == 'worker':
+        st.caption("Checkpoints save the inline kernel's variables; switch the kernel off to use them.")
+        return
+
+    col1, col2 = st.columns(2)
+    if col1.button("📌 Checkpoint", use_container_width=True, help="Save cells, results and variables to disk. Reopening this page's URL restores them without re-running."):
+        if not st.session_state.checkpoint_name:
+            st.session_state.checkpoint_name = uuid.uuid4().hex[:12]
+        st.query_params['notebook'] = st.session_state.checkpoint_name
+        with st.spinner("Saving checkpoint..."):
+            skipped = save_checkpoint(st.session_state.checkpoint_name)
+        st.success("✅ Checkpoint saved")
+        if skipped:
+            st.caption(f"Not saved (can't be pickled): {', '.join(skipped)}")
+
+    name = st.session_state.checkpoint_name
+    if name and checkpoint_exists(name):
+        if col2.button("♻️ Restore", use_container_width=True, help="Go back to the last checkpoint"):
+            restore_checkpoint(name)
+            st.rerun()
+        if st.button("🗑️ Delete checkpoint", use_container_width=True, help="Remove the saved checkpoint from disk"):
+            delete_checkpoint(name)
+            st.query_params.pop('notebook', None)
+            st.rerun()
+
+
+@track_activity
+def _set_kernel_mode():
+    # Each mode keeps its own namespace, so cells need to run again after a switch
+    if not st.session_state.use_worker_kernel and st.session_state.kernel_worker is not None:
+        restart_worker()
+    for cell in st.session_state.cells:
+        cell['run_digest'] = None
+    st.session_state.kernel_mode = 'worker' if st.session_state.use_worker_kernel else 'inline'
+
+
+@track_activity
+def _interrupt_kernel():
+    worker = st.session_state.kernel_worker
+    if worker is not None:
+        worker.interrupt()
+
+
+def render_kernel_controls():
+    """Kernel mode toggle plus interrupt/restart for the worker process"""
+    st.markdown("### ⚙️ Kernel")
+    st.toggle(
+        "Run cells in a separate process",
+        value=st.session_state.kernel_mode == 'worker',
+        key="use_worker_kernel",
+        on_change=_set_kernel_mode,
+        help="Long cells won't block the page and can be interrupted. Streamlit calls inside cells don't display in this mode."
+    )
+    if st.session_state.kernel_mode != 'worker':
+        st.toggle(
+            "Stream output while running",
+            key="stream_output",
+            help="Show a running cell's output and elapsed time as it goes. Clicking anything on the page stops the running cell."
+        )
+        st.toggle(
+            "Parallel Run All",
+            key="parallel_run_all",
+            help="Run cells that don't depend on each other at the same time in worker processes"
+        )
+        return
+
+    col1, col2 = st.columns(2)
+    col1.button(
+        "⏹️ Interrupt",
+        on_click=_interrupt_kernel,
+        use_container_width=True,
+        help="Stop the running cell (KeyboardInterrupt)"
+    )
+    if col2.button("🔁 Restart", use_container_width=True, help="Start a fresh kernel; all variables are lost"):
+        restart_worker()
+        st.rerun()
+
+
+@track_activity
+def _drop(row):
+    if row['kind'] == 'variable':
+        drop_variable(row['target'])
+    else:
+        drop_cell_result(row['target'])
+
+
+def render_memory_inspector():
+    """Largest variables and cell results by memory use, each with a button to drop it"""
+    st.markdown("### 🧠 Memory")
+    hibernation = st.session_state.hibernation
+    if hibernation['count']:
+        st.caption(
+            f"💤 Idle for {(hibernation['woke_at'] - hibernation['hibernated_at']) / 60:.0f} min, "
+            f"so this session was moved to disk; restored in {hibernation['wake_seconds']:.1f}s"
+        )
+    # Off by default: sizing walks every variable the first time
+    if not st.toggle("Show memory usage", key="show_memory", help="Variables and cell results by size. A value held by both a variable and a result counts under each."):
+        return
+
+    in_worker = st.session_state.kernel_mode == 'worker'
+    if in_worker:
+        st.caption("Variables live in the kernel process; only cell results are listed.")
+    rows = memory_report(include_variables=not in_worker)
+    if not rows:
+        st.caption("Nothing held yet.")
+        return
+
+    on_disk = sum(row['on_disk'] for row in rows)
+    st.caption(
+        f"{format_bytes(sum(row['size'] for row in rows))} in memory"
+        + (f" · {format_bytes(on_disk)} of results spilled to disk" if on_disk else "")
+    )
+    for row in rows[:MEMORY_INSPECTOR_ROWS]:
+        col1, col2 = st.columns([5, 1])
+        details = " · ".join(part for part in (row['type'], row['shape'], format_bytes(row['size'])) if part)
+        label = f"`{row['label']}`" if row['kind'] == 'variable' else row['label']
+        col1.markdown(f"**{label}**  \n{details}")
+        col2.button(
+            "🗑️",
+            key=f"drop_{row['kind']}_{row['target']}",
+            on_click=_drop,
+            args=(row,),
+            help="Delete this variable" if row['kind'] == 'variable' else "Clear this result (the cell runs again on Run All)"
+        )
+    if len(rows) > MEMORY_INSPECTOR_ROWS:
+        st.caption(f"... and {len(rows) - MEMORY_INSPECTOR_ROWS} smaller ones")
+
+
+def render_output_pages(cell):
+    """Page through the full output of a cell whose displayed output was cut down"""
+    spill = cell['output_spill']
+    st.caption(f"✂️ Output is long ({format_bytes(spill.size)}); only its start and end are shown above.")
+    if not st.toggle("Browse full output", key=f"output_pages_{cell['id']}"):
+        return
+    # Slices are read from disk only while the viewer is open
+    page_key = f"output_page_{cell['id']}"
+    if st.session_state.get(page_key, 1) > spill.pages:
+        # A re-run produced less output than the page we were on
+        st.session_state[page_key] = 1
+    page = st.number_input(
+        f"Page (of {spill.pages})",
+        min_value=1,
+        max_value=spill.pages,
+        value=1,
+        key=page_key
+    )
+    st.text(spill.read_page(page - 1))
+
+
+@st.fragment
+@track_activity
 def render_cell(cell, idx):
-    """Render a single notebook cell"""
+    """Render a single notebook cell.
+
+    Each cell is a fragment: running it or editing its widgets only
+    re-runs this function. Adding, copying or deleting cells changes the
+    layout and reruns the whole app.
+    """
     st.markdown('<div class="notebook-cell">', unsafe_allow_html=True)
-    
-    exec_count = f"[{cell.get('execution_count', '')}]" if cell.get('execution_count') else "[ ]"
-    st.markdown(f'''
-        <div class="cell-header">
-            <div>
-                <span class="cell-number">{exec_count}</span>
-                <span class="cell-type">Code Cell</span>
-            </div>
-        </div>
-    ''', unsafe_allow_html=True)
+    # Filled in after a Run below, so the execution count is current
+    header = st.empty()
     
     st.markdown('<div class="cell-controls">', unsafe_allow_html=True)
     col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 6])
@@ -156,6 +464,21 @@ def render_cell(cell, idx):
     add_btn = col2.button("➕ Add", key=f"add_{cell['id']}", help="Add cell below", use_container_width=True)
     copy_btn = col3.button("📋 Copy", key=f"copy_{cell['id']}", help="Duplicate this cell", use_container_width=True)
     delete_btn = col4.button("🗑️ Delete", key=f"del_{cell['id']}", help="Delete this cell", use_container_width=True)
+    col5a, col5b = col5.columns(2)
+    # Both work on the inline kernel's namespace; the worker kernel has its own
+    if st.session_state.kernel_mode != 'worker':
+        cell['memoize'] = col5a.checkbox(
+            "⚡ Cache result",
+            value=cell.get('memoize', False),
+            key=f"memo_{cell['id']}",
+            help="Reuse the previous result when the code and the data it reads haven't changed"
+        )
+        cell['snapshot'] = col5b.checkbox(
+            "📸 Snapshot",
+            value=cell.get('snapshot', False),
+            key=f"snapshot_{cell['id']}",
+            help="Keep the variables as they are after this cell runs, so you can rewind to this point and re-run the cells below"
+        )
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -173,25 +496,62 @@ def render_cell(cell, idx):
     cell['content'] = cell_code
     
     st.markdown('</div>', unsafe_allow_html=True)
+
+    if add_btn:
+        add_cell(position=idx + 1)
+        st.rerun()
+    
+    if copy_btn:
+        add_cell(content=cell['content'], position=idx + 1)
+        st.rerun()
+    
+    if delete_btn:
+        if len(st.session_state.cells) > 1:
+            delete_cell(cell['id'])
+            st.rerun()
+        else:
+            st.warning("⚠️ Cannot delete the last cell")
+
+    if run_btn:
+        # Run before drawing the output, so this pass shows the result
+        # without another rerun
+        execute_cell(cell['id'], cell_code)
+
+    exec_count = f"[{cell.get('execution_count', '')}]" if cell.get('execution_count') else "[ ]"
+    header.markdown(f'''
+        <div class="cell-header">
+            <div>
+                <span class="cell-number">{exec_count}</span>
+                <span class="cell-type">Code Cell</span>
+            </div>
+        </div>
+    ''', unsafe_allow_html=True)
     
     if cell['executed']:
         st.markdown('<div class="cell-output">', unsafe_allow_html=True)
         
-        if cell.get('dataframe') is not None:
-            st.dataframe(cell['dataframe'], use_container_width=True)
-        
-        if cell.get('series') is not None:
-            st.dataframe(cell['series'], use_container_width=True)
-        
-        if cell.get('figure') is not None:
-            try:
-                st.plotly_chart(cell['figure'], use_container_width=True)
-            except Exception as plot_error:
-                st.warning(f"⚠️ Could not display chart: {plot_error}")
+        # Values spilled to disk to stay within the memory budget are read back here
+        displays = st.session_state.result_store.load(cell['id'], cell.get('displays'))
+        for i, display in enumerate(displays or []):
+            render_display(display, (cell['id'], i), cell['execution_count'])
         
+        if cell.get('memo_hit'):
+            st.caption("⚡ Cached result (code and inputs unchanged)")
+
+        if cell.get('snapshot') and can_rewind(cell['id']):
+            if st.button(
+                "⏪ Rewind to here",
+                key=f"rewind_{cell['id']}",
+                help="Restore the variables to how they were right after this cell ran. Run All then re-runs only the cells below."
+            ):
+                rewind_to(cell['id'])
+                st.rerun()
+
         if cell.get('output'):
             st.text(cell['output'])
-        elif cell.get('dataframe') is None and cell.get('series') is None and cell.get('figure') is None:
+            if cell.get('output_spill') is not None:
+                render_output_pages(cell)
+        elif not cell.get('displays'):
             st.markdown('<div class="success-msg">✓ Executed successfully</div>', unsafe_allow_html=True)
         
         st.markdown('</div>', unsafe_allow_html=True)
@@ -207,25 +567,50 @@ def render_cell(cell, idx):
         st.markdown('</div>', unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
-    
-    if run_btn:
-        execute_cell(cell['id'], cell_code)
-        st.rerun()
-    
-    if add_btn:
-        add_cell(position=idx + 1)
-        st.rerun()
-    
-    if copy_btn:
-        add_cell(content=cell['content'], position=idx + 1)
-        st.rerun()
-    
-    if delete_btn:
-        if len(st.session_state.cells) > 1:
-            delete_cell(cell['id'])
-            st.rerun()
-        else:
-            st.warning("⚠️ Cannot delete the last cell")
+
+
+def _visible_window(cells):
+    """(start, end) indexes of the cells to render in full, centred on the focused cell"""
+    ids = [cell['id'] for cell in cells]
+    focused = st.session_state.focused_cell
+    focus = ids.index(focused) if focused in ids else len(cells) - 1
+    start = min(max(0, focus - NOTEBOOK_WINDOW_CELLS // 2), max(0, len(cells) - NOTEBOOK_WINDOW_CELLS))
+    return start, start + NOTEBOOK_WINDOW_CELLS
+
+
+@track_activity
+def _focus_cell(cell_id):
+    st.session_state.focused_cell = cell_id
+
+
+def _output_kind(cell):
+    if cell.get('error'):
+        return "❌ Error"
+    if not cell['executed']:
+        return "not run"
+    if cell.get('displays'):
+        return " + ".join(dict.fromkeys(display_title(display) for display in cell['displays']))
+    if cell.get('output'):
+        return "📝 Text"
+    return "✓ No output"
+
+
+def render_cell_summary(cell, idx):
+    """One-line stand-in for a cell outside the visible window; clicking it opens the cell"""
+    exec_count = f"[{cell['execution_count']}]" if cell.get('execution_count') else "[ ]"
+    first_line = next((line.strip() for line in cell['content'].splitlines() if line.strip()), "(empty)")
+    if len(first_line) > 70:
+        first_line = first_line[:67] + "..."
+    # Shown as inline code so the label isn't read as markdown
+    first_line = first_line.replace('`', "'")
+    st.button(
+        f"{exec_count} `{first_line}` · {_output_kind(cell)}",
+        key=f"focus_{cell['id']}",
+        on_click=_focus_cell,
+        args=(cell['id'],),
+        type="tertiary",
+        help=f"Cell {idx + 1}: click to open"
+    )
 
 
 def render_main_content():
@@ -237,8 +622,30 @@ def render_main_content():
             add_cell()
             st.rerun()
     else:
-        for idx, cell in enumerate(st.session_state.cells):
-            render_cell(cell, idx)
+        st.session_state.result_store.begin_pass()
+        # Pick up a worker run whose wait was cut short by an earlier rerun
+        worker = st.session_state.kernel_worker
+        if st.session_state.kernel_mode == 'worker' and worker is not None and worker.pending is not None:
+            finish_worker_run()
+
+        cells = st.session_state.cells
+        start, end = 0, len(cells)
+        if len(cells) >= NOTEBOOK_COMPACT_MIN_CELLS:
+            compact = st.toggle(
+                "Compact view",
+                value=True,
+                key="compact_notebook",
+                help="Only fully render the cells around the focused one; click a summary line to open that cell"
+            )
+            if compact:
+                start, end = _visible_window(cells)
+                st.caption(f"Showing cells {start + 1}–{end} of {len(cells)}")
+
+        for idx, cell in enumerate(cells):
+            if start <= idx < end:
+                render_cell(cell, idx)
+            else:
+                render_cell_summary(cell, idx)
         
         st.markdown("---")
         if st.button("➕ Add New Cell at Bottom", type="secondary", use_container_width=False):
@@ -248,22 +655,31 @@ def render_main_content():
 
 def render_header():
     """Render the page header with title and action buttons"""
-    col1, col2 = st.columns([3, 1])
+    col1, col2 = st.columns([3, 1.5])
     with col1:
         st.title("📓 Data Analysis Notebook")
         st.markdown("*A beginner-friendly environment to analyze data with Python*")
 
     with col2:
-        col2a, col2b = st.columns(2)
+        col2a, col2b, col2c = st.columns(3)
         with col2a:
-            if st.button("▶️ Run All", use_container_width=True, help="Execute all cells in order"):
-                from cell_manager import execute_cell
-                for cell in st.session_state.cells:
-                    execute_cell(cell['id'], cell['content'])
+            if st.button("▶️ Run All", use_container_width=True, help="Run changed cells and the cells that depend on them"):
+                run_all(parallel=st.session_state.parallel_run_all)
                 st.rerun()
         with col2b:
+            if st.button("⏩ Rerun All", use_container_width=True, help="Execute all cells in order"):
+                run_all(force=True, parallel=st.session_state.parallel_run_all)
+                st.rerun()
+        with col2c:
             if st.button("🔄 Clear All", use_container_width=True, help="Clear all cells"):
                 st.session_state.cells = []
-                st.session_state.variables = {}
+                st.session_state.variables = new_namespace()
                 st.session_state.execution_count = 0
+                st.session_state.run_counter = 0
+                st.session_state.external_writes = {}
+                st.session_state.result_memo.clear()
+                st.session_state.result_store.clear()
+                st.session_state.snapshots.clear()
+                if st.session_state.kernel_worker is not None:
+                    restart_worker()
                 st.rerun()